@@ -13,16 +13,21 @@
 #
 # *****************************************************************************
 
+import os
 import random
+import threading
+import h5py
 import numpy as np
-from collections import deque
-from keras.models import Sequential
-from keras.layers import Dense
-from keras.optimizers import Adam
-
-class DDQN_Agent:
-    def __init__(self, state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length):
-        self.state_size = state_size                # number of environment state inputs
+from Memory import ReplayMemory, PrioritizedReplayMemory, NStepBuilder
+from NumpyNet import NumpyMLP, NullGraph
+
+build_lock = threading.Lock()   # models are built one at a time (Keras model building is not thread safe)
+
+class DDQN_Agent(object):
+    def __init__(self, state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length, prioritized=False, fast_inference=True, backend="keras", background_build=False, memory_path=None, train_every=1, gradient_steps=1, history_length=1, n_step=1, tau=None, replay_storage="float32"):
+        self.state_size = state_size                # number of environment state inputs (per frame)
+        self.history_length = history_length        # number of most recent frames that form a state (1 = no frame stacking)
+        self.input_size = state_size * history_length   # number of NN inputs (stacked state values)
         self.action_size = action_size              # number of possible actions
         self.gamma = gamma                          # discount rate (e.g., .99)
         self.learning_rate = learning_rate          # learning rate (e.g., .0025)
@@ -31,51 +36,259 @@ class DDQN_Agent:
         self.epsilon_min = epsilon_min              # minimum exploration rate  (e.g., .05)
         self.epsilon_delay = epsilon_delay          # delay (n-frames) before exploration decay starts  (e.g., 25000)
         self.memory_length = memory_length          # size of replay memory
-        self.memory = deque(maxlen=memory_length)   # replay memory array (tracks last n [s,a,r,s'] updates)
-        self.model = self._build_model()
-        self.target_model = self._build_model()
+        self.prioritized = prioritized              # use prioritized (TD error) rather than uniform replay sampling
+        self.backend = backend                      # NN backend ("keras" or "numpy" - pure numpy, no TensorFlow import)
+        self.memory_path = memory_path              # directory of memory-mapped replay memory files (None = replay memory in RAM)
+        self.train_every = train_every              # train the model every n replay calls (decision steps)
+        self.gradient_steps = gradient_steps        # number of minibatches (gradient steps) trained per training step
+        self.replay_count = 0                       # number of replay calls
+        self.remember_count = 0                     # number of remember calls (transitions given to remember)
+        self.n_step = n_step                        # number of rewards per (n-step) transition remembered (1 = 1-step transitions)
+        self.nstep_builders = {}                    # n-step transition builder for each source (game or player) of transitions
+        self.tau = tau                              # soft target model update rate per training step (None = target model is copied by update_target_model)
+        self.soft_update = None                     # soft target model update function (built on first use)
+        self.replay_storage = replay_storage        # replay memory state storage ("float32", or compact "float16" or "int16")
+        if n_step > 1 and history_length > 1:
+            raise ValueError("n-step transitions are not supported with frame stacking (history_length > 1)")
+        if prioritized:
+            self.memory = PrioritizedReplayMemory(state_size, memory_length, memory_path, history_length=history_length, discounted=n_step > 1, storage=replay_storage)    # prioritized replay memory (sum-tree indexed)
+        else:
+            self.memory = ReplayMemory(state_size, memory_length, memory_path, history_length=history_length, discounted=n_step > 1, storage=replay_storage)   # replay memory ring buffer (tracks last n [s,a,r,s'] updates)
+        self.lock = threading.Lock()                # guards replay memory when a learner thread trains the model
+        self.train_lock = threading.Lock()          # held by a learner thread for each training step (so a snapshot is not taken mid-step)
+        self.fast_inference = fast_inference        # act using a numpy forward pass of act_model (rather than Keras predict)
+        self.act_weights = None                     # numpy copy of act_model weights (for fast inference)
+        self.act_weights_stale = True               # act_model weights have changed since act_weights were copied
+        self.models_ready = threading.Event()       # set once the models have been built
+        self.build_error = None                     # error raised while building the models (in the background)
+        if background_build:
+            builder = threading.Thread(target=self._build_models)
+            builder.daemon = True
+            builder.start()
+        else:
+            self._build_models()
+
+    # Build (and warm up) the models
+    # With background_build, this runs in a background thread, so a script can bind its socket and wait for a
+    # game connection while Keras/TensorFlow is imported and the models are built. Using a model waits until
+    # the models are ready
+    def _build_models(self):
+        try:
+            with build_lock:
+                self._model = self._build_model()
+                self._target_model = self._build_model()
+                self._act_model = self._model       # model used to act (a separate copy when a learner thread trains the model)
+                if self.backend == "numpy":
+                    self._graph = NullGraph()       # numpy models have no graph (can be used in any thread)
+                else:
+                    from keras import backend as K
+                    self._graph = K.get_session().graph     # graph of the models (needed to use the models in other threads)
+                    self._model._make_predict_function()
+                    self._model._make_train_function()
+                    self._target_model._make_predict_function()
+        except Exception as e:
+            self.build_error = e
+        self.models_ready.set()
+
+    # Wait until the models have been built
+    def wait_for_models(self):
+        self.models_ready.wait()
+        if self.build_error is not None:
+            raise self.build_error
+
+    @property
+    def model(self):
+        self.wait_for_models()
+        return self._model
+
+    @property
+    def target_model(self):
+        self.wait_for_models()
+        return self._target_model
+
+    @property
+    def act_model(self):
+        self.wait_for_models()
+        return self._act_model
+
+    @act_model.setter
+    def act_model(self, model):
+        self._act_model = model
+
+    @property
+    def graph(self):
+        self.wait_for_models()
+        return self._graph
 
     # Neural Network for DQ RL Model
+    # Keras (and TensorFlow) is only imported when the first keras model is built
     def _build_model(self):
+        if self.backend == "numpy":
+            return NumpyMLP(self.input_size, [20, 20], self.action_size, self.learning_rate)
+        if self.backend != "keras":
+            raise ValueError("Unknown NN backend: {}".format(self.backend))
+        from keras.models import Sequential
+        from keras.layers import Dense
+        from keras.optimizers import Adam
         model = Sequential()
-        model.add(Dense(20, input_dim=self.state_size, activation='relu'))
+        model.add(Dense(20, input_dim=self.input_size, activation='relu'))
         model.add(Dense(20, activation='relu', kernel_initializer='uniform'))
         model.add(Dense(self.action_size, activation='linear'))
         model.compile(loss='mse', optimizer=Adam(lr=self.learning_rate))
         return model
 
     # Update target mode by copying weights from model to target_model
+    # (with soft target updates, the target model is updated after every training step instead)
     def update_target_model(self):
+        if self.tau:
+            return
         self.target_model.set_weights(self.model.get_weights())
 
+    # Soft (Polyak) update of target model: target = tau * model + (1 - tau) * target, in place
+    def soft_update_target_model(self):
+        if self.soft_update is None:
+            with build_lock:
+                self.soft_update = self._build_soft_update()
+        self.soft_update()
+
+    # Build the soft target model update function, so no weight arrays are allocated per update:
+    # for keras models, one TensorFlow op that assigns the new target weights; for numpy models, an
+    # in-place update of the target weights using preallocated buffers
+    def _build_soft_update(self):
+        tau = self.tau
+        if self.backend == "numpy":
+            pairs = list(zip(self.target_model.weights, self.model.weights))
+            buffers = [np.empty_like(w) for w in self.model.weights]
+            def update():
+                for (target, w), buf in zip(pairs, buffers):
+                    np.subtract(w, target, out=buf)
+                    buf *= tau
+                    target += buf
+            return update
+        from keras import backend as K
+        updates = [K.update(target, tau * w + (1 - tau) * target) for target, w in zip(self.target_model.weights, self.model.weights)]
+        function = K.function([], [], updates=updates)
+        return lambda: function([])
+
+    # Use a separate copy of the model to act, so the model can be trained (in another thread) while acting
+    def separate_act_model(self):
+        self.wait_for_models()
+        with build_lock:
+            self.act_model = self._build_model()
+            self.model._make_predict_function()
+            self.model._make_train_function()
+            self.target_model._make_predict_function()
+            self.act_model._make_predict_function()
+        self.publish_weights()
+
+    # Update model used to act by copying weights from model to act_model
+    def publish_weights(self):
+        if self.act_model is not self.model:
+            self.act_model.set_weights(self.model.get_weights())
+        self.act_weights_stale = True
+
+    # Numpy copy of act_model weights (copied again only after act_model weights have changed)
+    def act_model_weights(self):
+        if self.act_weights_stale:
+            self.act_weights_stale = False
+            self.act_weights = self.act_model.get_weights()
+        return self.act_weights
+
+    # Q values of act_model for a batch of states, computed directly in numpy from a copy of the weights
+    # (for a small network, Keras predict call overhead is much larger than the forward pass itself)
+    def q_values(self, state):
+        w = self.act_model_weights()
+        x = np.asarray(state, dtype=np.float32)
+        for i in range(0, len(w) - 2, 2):
+            x = np.maximum(np.dot(x, w[i]) + w[i + 1], 0)   # hidden layers (relu)
+        return np.dot(x, w[-2]) + w[-1]                     # output layer (linear)
+
+    # Q values of act_model for a batch of states
+    def predict_act(self, state):
+        if self.fast_inference:
+            return self.q_values(state)
+        return self.act_model.predict(state, batch_size=len(state))
+
     # Update agent memeory array
-    def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+    # With n-step transitions, each source (game or player) of transitions must be given, as the transitions
+    # of each source are built into n-step transitions separately (a transition is remembered once complete)
+    def remember(self, state, action, reward, next_state, done, source=None):
+        self.remember_count += 1
+        if self.n_step == 1:
+            with self.lock:
+                self.memory.append(state, action, reward, next_state, done)
+            return
+        builder = self.nstep_builders.get(source)
+        if builder is None:
+            builder = self.nstep_builders[source] = NStepBuilder(self.n_step, self.gamma, self.input_size)
+        transitions = builder.add(state, action, reward, next_state, done)
+        with self.lock:
+            for transition in transitions:
+                self.memory.append(*transition)
 
     # Act in a epsilone-greedy manner (DQ trainging action - model + random defined actions)
+    # If state is a batch of more than one state (a 2-D array, one row per game), an array of actions is
+    # returned (see act_batch); a single state (a 1-D state, or a batch of one row) returns a single action
     def act(self, state):
+        if np.ndim(state) == 2 and np.shape(state)[0] > 1:
+            return self.act_batch(state)
         if np.random.rand() <= self.epsilon:
             return random.randrange(self.action_size)
-        act_values = self.model.predict(state)
+        act_values = self.predict_act(np.reshape(state, (1, -1)))
         return np.argmax(act_values[0])  # returns action
+
+    # Act in a epsilon-greedy manner for a batch of states (one row per game, any number of rows);
+    # returns an array of actions, using a single predict call for the whole batch
+    def act_batch(self, states):
+        actions = np.argmax(self.predict_act(states), axis=1)
+        explore = np.random.rand(len(states)) <= self.epsilon
+        actions[explore] = np.random.randint(self.action_size, size=explore.sum())
+        return actions
     
-    # Action Replay Process for DQN RL
+    # Action Replay Process for DQN RL (train on gradient_steps minibatches every train_every calls, then decay exploration rate)
     def replay(self, batch_size, delay_count):
-        batch_size = min(batch_size, len(self.memory))
-        minibatch = random.sample(self.memory, batch_size)
-        X = np.zeros((batch_size, self.state_size))
-        Y = np.zeros((batch_size, self.action_size))
-        for i in range(batch_size):
-            state, action, reward, next_state, done = minibatch[i]
-            target = self.model.predict(state)[0]
-            if done:
-                target[action] = reward
-            else:
-                a = np.argmax(self.model.predict(next_state)[0])
-                t = self.target_model.predict(next_state)[0]
-                target[action] = reward + self.gamma * t[a]
-            X[i], Y[i] = state, target
-        self.model.fit(X, Y, batch_size=batch_size, epochs=1, verbose=0)
+        self.replay_count += 1
+        if self.replay_count % self.train_every == 0:
+            self.train_minibatch(batch_size, self.gradient_steps)
+        self.decay_epsilon(delay_count)
+
+    # Train model on gradient_steps minibatches sampled from replay memory
+    # All minibatches are sampled in one go and stacked into state/next-state arrays so that the online
+    # Q(s), online Q(s') (for the argmax action) and target Q(s') values are each computed with one batched
+    # predict call, and the minibatches are trained with one fit call (one gradient step per minibatch;
+    # the targets of later minibatches are computed before the earlier minibatches are trained)
+    # With prioritized replay, importance-sampling weights are applied to the loss and the sampled
+    # transitions' priorities are updated from their new TD errors
+    # With n-step transitions, the target Q(s') value is discounted by each transition's own discount (gamma^n)
+    # With soft target updates (tau), the target model is soft updated after each training step
+    def train_minibatch(self, batch_size, gradient_steps=1):
+        with self.lock:
+            num_samples = min(batch_size * gradient_steps, len(self.memory))
+            if num_samples == 0:
+                return                                  # (nothing remembered yet)
+            batch_size = min(batch_size, num_samples)
+            indices = self.memory.sample_indices(num_samples)
+            states, actions, rewards, next_states, dones = self.memory.get(indices)
+            weights = self.memory.importance_weights(indices)
+            discounts = self.memory.discount_factors(indices)
+            writes = self.memory.write_counts(indices)
+        rows = np.arange(num_samples)
+        Y = self.model.predict(states, batch_size=num_samples)
+        a = np.argmax(self.model.predict(next_states, batch_size=num_samples), axis=1)
+        t = self.target_model.predict(next_states, batch_size=num_samples)[rows, a]
+        targets = np.where(dones, rewards, rewards + (self.gamma if discounts is None else discounts) * t)
+        td_errors = targets - Y[rows, actions]
+        Y[rows, actions] = targets
+        self.model.fit(states, Y, batch_size=batch_size, epochs=1, verbose=0, sample_weight=weights)
+        if self.tau:
+            self.soft_update_target_model()
+        if self.act_model is self.model:
+            self.act_weights_stale = True
+        with self.lock:
+            self.memory.update_priorities(indices, td_errors, writes)
+
+    # Decay exploration rate (after delay of epsilon_delay frames)
+    def decay_epsilon(self, delay_count):
         if delay_count > self.epsilon_delay: 
         	if self.epsilon > self.epsilon_min:
         		self.epsilon *= self.epsilon_decay
@@ -83,11 +296,75 @@ class DDQN_Agent:
     # Load previous saved weights for NN model
     def load(self, name):
         self.model.load_weights(name)
+        self.publish_weights()
 
     # Save weights for NN model
     def save(self, name):
         self.model.save_weights(name)
 
+    # Save full training state to one (HDF5) file, so training can be resumed where it stopped: model, target model
+    # and optimizer weights, exploration rate, replay and remember counts (the train_every phase), prioritized replay
+    # state (beta, max priority and slot write counts) and any training counters given (e.g., fcount=..., episode=...)
+    # The file is written under a temporary name and then renamed, so an interrupted save never replaces a snapshot
+    # With a learner thread, the learner is paused while the weights are copied, so all of them are from the same training step
+    def save_snapshot(self, name, **counters):
+        with self.train_lock:                       # (weights are copied between, not during, a learner thread's training steps)
+            self.model._make_train_function()       # (creates Keras optimizer weights, if not created yet)
+            state = [("model", self.model.get_weights()), ("target_model", self.target_model.get_weights()),
+                     ("optimizer", self.model.optimizer.get_weights())]
+            with self.lock:
+                replay_count, remember_count = self.replay_count, self.remember_count
+                if self.prioritized:
+                    memory_state = (self.memory.beta, self.memory.max_priority, self.memory.writes.copy())
+        f = h5py.File(name + ".tmp", "w")
+        try:
+            for group_name, weights in state:
+                group = f.create_group(group_name)
+                for i, w in enumerate(weights):
+                    group.create_dataset(str(i), data=w)
+            f.attrs["epsilon"] = self.epsilon
+            f.attrs["replay_count"] = replay_count
+            f.attrs["remember_count"] = remember_count
+            if self.prioritized:
+                memory_group = f.create_group("memory")
+                memory_group.attrs["beta"], memory_group.attrs["max_priority"] = memory_state[:2]
+                memory_group.create_dataset("writes", data=memory_state[2])
+            counters_group = f.create_group("counters")
+            for key, value in counters.items():
+                counters_group.attrs[key] = value
+        finally:
+            f.close()
+        os.rename(name + ".tmp", name)
+
+    # Restore training state saved by save_snapshot; returns the training counters (as a dict)
+    def load_snapshot(self, name):
+        f = h5py.File(name, "r")
+        try:
+            state = {}
+            for group_name in ("model", "target_model", "optimizer"):
+                group = f[group_name]
+                state[group_name] = [group[str(i)][()] for i in range(len(group))]
+            self.epsilon = float(f.attrs["epsilon"])
+            replay_count, remember_count = int(f.attrs["replay_count"]), int(f.attrs["remember_count"])
+            memory_state = None
+            if self.prioritized and "memory" in f:
+                memory_group = f["memory"]
+                memory_state = (float(memory_group.attrs["beta"]), float(memory_group.attrs["max_priority"]), memory_group["writes"][()])
+            counters = dict((key, value.item()) for key, value in f["counters"].attrs.items())
+        finally:
+            f.close()
+        self.model.set_weights(state["model"])
+        self.target_model.set_weights(state["target_model"])
+        self.model._make_train_function()
+        self.model.optimizer.set_weights(state["optimizer"])
+        with self.lock:
+            self.replay_count, self.remember_count = replay_count, remember_count
+            if memory_state is not None:
+                self.memory.beta, self.memory.max_priority = memory_state[:2]
+                self.memory.writes[:] = memory_state[2]
+        self.publish_weights()
+        return counters
+
     # Save current agent parameters
     def save_agent_parameters(self, name):
         dfile = open(name, "w")
@@ -98,8 +375,23 @@ class DDQN_Agent:
         dfile.write("Epsilon delay: " + str(self.epsilon_delay) + "\n")
         dfile.write("Learning rate: " + str(self.learning_rate) + "\n")
         dfile.write("Memory length: " + str(self.memory_length) + "\n")
+        dfile.write("Prioritized replay: " + str(self.prioritized) + "\n")
+        dfile.write("Backend: " + self.backend + "\n")
+        dfile.write("Replay memory files: " + str(self.memory_path) + "\n")
+        dfile.write("Train every: " + str(self.train_every) + "\n")
+        dfile.write("Gradient steps: " + str(self.gradient_steps) + "\n")
+        dfile.write("History length: " + str(self.history_length) + "\n")
+        dfile.write("N-step: " + str(self.n_step) + "\n")
+        dfile.write("Soft target update rate (tau): " + str(self.tau) + "\n")
+        dfile.write("Replay storage: " + self.replay_storage + "\n")
         dfile.close()
 
-    # resets replay memeory (deque) to emplty.
+    # resets replay memeory (ring buffer) to emplty.
     def erase_replay_memory(self):
-        self.memory = deque() 
\ No newline at end of file
+        self.memory.clear()
+        self.nstep_builders = {}
+
+    # Save replay memory to its memory-mapped files, so training can be resumed with it (does nothing if memory is in RAM)
+    def flush_replay_memory(self):
+        with self.lock:
+            self.memory.flush()
\ No newline at end of file
@@ -0,0 +1,98 @@
+# *****************************************************************************
+#
+# Asynchronous Checkpoint (NN weights file) Writer for DQN Agents
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# At the end of an episode the agent's NN weights are copied (snapshot) in
+# memory and written to an HDF5 weights file by a background thread, so the
+# game loop does not wait on disk I/O. Weights files use the same layout as
+# Keras save_weights, so they can be loaded with agent.load (model.load_weights).
+#
+# Checkpoints can be saved every n episodes, for the best episode reward so far,
+# and only the last k episode files kept.
+#
+# *****************************************************************************
+
+import os
+import sys
+import threading
+import h5py
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+class CheckpointManager:
+    def __init__(self, agent, prefix, every=1, keep_last=0, save_best=True):
+        self.agent = agent                  # agent whose model weights are saved
+        self.prefix = prefix                # weights filename prefix (files are prefix_ep<episode>.h5 and prefix_best.h5)
+        self.every = every                  # save weights every n episodes (0 = never)
+        self.keep_last = keep_last          # number of most recent episode weights files kept (0 = keep all)
+        self.save_best = save_best          # save weights for best episode reward (in prefix_best.h5)
+        self.best_reward = None             # best episode reward so far
+        self.saved = []                     # episode weights files saved (oldest first)
+        self.jobs = queue.Queue()           # write/delete jobs for background thread
+        self.writer = threading.Thread(target=self._write_jobs)
+        self.writer.daemon = True
+        self.writer.start()
+
+    # Process end of episode: snapshot weights and queue weights files to be written (if due)
+    def episode_end(self, episode, episode_reward):
+        fnames = []
+        if self.every and episode % self.every == 0:
+            fnames.append(self.prefix + "_ep" + str(episode) + ".h5")
+        if self.save_best and (self.best_reward is None or episode_reward > self.best_reward):
+            self.best_reward = episode_reward
+            fnames.append(self.prefix + "_best.h5")
+        if fnames:
+            layout, weights = weights_snapshot(self.agent.model)
+            for fname in fnames:
+                self.jobs.put((fname, layout, weights))
+        if self.every and episode % self.every == 0 and self.keep_last:
+            self.saved.append(fnames[0])
+            while len(self.saved) > self.keep_last:
+                self.jobs.put((self.saved.pop(0), None, None))
+
+    # Wait for all queued weights files to be written and stop background thread
+    def close(self):
+        self.jobs.put(None)
+        self.writer.join()
+
+    def _write_jobs(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fname, layout, weights = job
+            if weights is None:
+                if os.path.exists(fname):
+                    os.remove(fname)
+            else:
+                write_weights(fname, layout, weights)
+
+
+# Return the layer/weight names and a copy of the weights of a model
+def weights_snapshot(model):
+    layout = [(layer.name, [w.name for w in layer.weights]) for layer in model.layers]
+    return layout, [np.array(w) for w in model.get_weights()]
+
+# Write weights to an HDF5 file using the Keras save_weights layout
+# layout is a list of (layer name, [weight names]) and weights a flat list of weight arrays
+def write_weights(fname, layout, weights):
+    f = h5py.File(fname, "w")
+    try:
+        f.attrs["layer_names"] = np.array([name.encode("utf8") for name, _ in layout])
+        f.attrs["backend"] = b"tensorflow"
+        keras_version = getattr(sys.modules.get("keras"), "__version__", None)
+        if keras_version:
+            f.attrs["keras_version"] = keras_version.encode("utf8")
+        i = 0
+        for name, weight_names in layout:
+            g = f.create_group(name)
+            g.attrs["weight_names"] = np.array([w.encode("utf8") for w in weight_names])
+            for weight_name in weight_names:
+                g.create_dataset(weight_name, data=weights[i])
+                i += 1
+    finally:
+        f.close()
@@ -0,0 +1,42 @@
+# *****************************************************************************
+#
+# Frame History (Frame Stacking) for DQN Agents Playing Unity Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# A FrameHistory keeps the last K processed game frames, so an agent's state can
+# be the last K frames (oldest first, as one row) rather than only the current
+# frame, giving the agent temporal context.
+#
+# The frames are kept in a circular buffer of 2K rows where each frame is written
+# twice (at rows i and i + K), so the last K frames are always one contiguous
+# slice of the buffer: the state is returned as a view of the buffer (no frames
+# are copied). The view is only valid until the next push or reset.
+#
+# *****************************************************************************
+
+import numpy as np
+
+class FrameHistory:
+    def __init__(self, frame_size, history_length):
+        self.frame_size = frame_size                # number of values per frame
+        self.history_length = history_length        # number of frames per state (K)
+        self.buffer = np.zeros((2 * history_length, frame_size), dtype=np.float32)    # frames (each written to rows i and i + K)
+        self.pos = 0                                # row the next frame is written to (0 to K-1)
+
+    # Start a new history (e.g., at the start of an episode): all K frames are set to frame; returns the state
+    def reset(self, frame):
+        self.buffer[:] = np.reshape(frame, self.frame_size)
+        self.pos = 0
+        return self.state()
+
+    # Add the newest frame (the oldest frame is dropped); returns the state
+    def push(self, frame):
+        frame = np.reshape(frame, self.frame_size)
+        self.buffer[self.pos] = frame
+        self.buffer[self.pos + self.history_length] = frame
+        self.pos = (self.pos + 1) % self.history_length
+        return self.state()
+
+    # Last K frames (oldest first) as one row (shape [1, K * frame_size]); a view of the buffer
+    def state(self):
+        return self.buffer[self.pos:self.pos + self.history_length].reshape(1, -1)
@@ -0,0 +1,74 @@
+# *****************************************************************************
+#
+# Learner Thread for DQN Agents Playing Unity Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# Trains an agent's model continuously in a background thread, so the game
+# loop only has to act and remember (no gradient steps between receiving a game
+# frame and sending the next action). The agent acts using a separate copy of
+# the model, whose weights are updated (published) every publish_steps training
+# steps. The target model is updated every target_steps training steps (or, with
+# soft target updates, after every training step).
+# Each training step is done holding the agent's train_lock, so a snapshot
+# (save_snapshot) is only taken between training steps.
+# Training is throttled to at most replay_ratio minibatches (gradient steps) per
+# transition remembered since the learner started, so the learner does not take
+# the GIL from the game loop (e.g., with the numpy backend) to train on the same
+# transitions over and over; it sleeps until more transitions are remembered.
+#
+# A Learner can be used in place of the agent for replay and update_target_model
+# calls in a training script: replay only decays the exploration rate (training
+# is done by the learner thread) and update_target_model does nothing.
+#
+# *****************************************************************************
+
+import threading
+import time
+
+class Learner(threading.Thread):
+    def __init__(self, agent, batch_size, target_steps, publish_steps=25, min_memory=None, replay_ratio=1.):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.agent = agent                          # agent (DDQN_Agent) to train
+        self.batch_size = batch_size                # size of action replay minibatch
+        self.target_steps = target_steps            # update target model every n training steps
+        self.publish_steps = publish_steps          # update model used to act every n training steps
+        self.min_memory = min_memory or batch_size  # number of transitions in memory before training starts
+        self.replay_ratio = replay_ratio            # max number of minibatches trained per remembered transition (None = no limit)
+        self.remember_start = agent.remember_count  # agent's remember count when the learner was created
+        self.steps = 0                              # number of training steps (train_minibatch calls of agent.gradient_steps minibatches) completed
+        self.stopping = threading.Event()
+
+    # Train continuously until stopped
+    # (the agent's models may still be being built in the background when the learner is started)
+    def run(self):
+        with self.agent.graph.as_default():
+            self.agent.separate_act_model()
+            while not self.stopping.is_set():
+                if len(self.agent.memory) < self.min_memory:
+                    time.sleep(.01)
+                    continue
+                if self.replay_ratio is not None and (self.steps + 1) * self.agent.gradient_steps > self.replay_ratio * (self.agent.remember_count - self.remember_start):
+                    time.sleep(.001)
+                    continue
+                with self.agent.train_lock:
+                    self.agent.train_minibatch(self.batch_size, self.agent.gradient_steps)
+                    self.steps += 1
+                    if self.steps % self.publish_steps == 0:
+                        self.agent.publish_weights()
+                    if self.steps % self.target_steps == 0:
+                        self.agent.update_target_model()
+
+    # Stop training (and wait for the current training step to finish)
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
+
+    # Decay agent's exploration rate (replay minibatches are processed by the learner thread)
+    def replay(self, batch_size, delay_count):
+        self.agent.decay_epsilon(delay_count)
+
+    # Target model is updated by the learner thread
+    def update_target_model(self):
+        pass
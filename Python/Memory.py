@@ -0,0 +1,458 @@
+# *****************************************************************************
+#
+# Replay Memory for DQN Agents Playing Unity Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# Transitions are stored in preallocated (contiguous) numpy arrays that are
+# used as a ring buffer, so adding a transition is O(1) and a minibatch is
+# returned as ready-to-feed arrays using vectorized index sampling.
+#
+# If a directory (path) is given, the arrays are memory-mapped .npy files in that
+# directory, so the memory can be larger than RAM, is kept when training stops
+# (call flush to save the current write position) and is reopened (resumed) when
+# a memory is created with the same path. A memory can also be opened read-only
+# (e.g., to share it with other processes).
+#
+# With a history length of K > 1 (frame stacking), a state is the last K frames
+# (oldest first, see History.py) and each frame is stored once: slot i holds the
+# newest frame of transition i's next state, and the stacked s and s' are rebuilt
+# by index from the slots before it. A transition whose state does not continue
+# the previous transition (e.g., the first transition of an episode) is preceded
+# by a head slot holding its state's newest frame; the frames before a head are
+# taken to be copies of it (as after FrameHistory.reset). Head slots are never
+# sampled. Transitions should be remembered in the order they happen (one game
+# per memory).
+#
+# A memory can also store a discount for each transition (e.g., gamma^n for the
+# n-step transitions made by an NStepBuilder), to be used in place of the agent's
+# discount rate when bootstrapping from the transition's next state.
+#
+# Storage can be made compact (about half the memory per transition, so a longer
+# memory fits in the same RAM): states (frames) are stored as float16, or as int16
+# scaled by 32767 / state_max (states are clipped to +/- state_max; the scripts'
+# states are already within [-1, 2]), actions as uint8 (up to 256 actions) and
+# done flags as bits (8 per byte). Minibatches are decoded to float32 in one go.
+#
+# *****************************************************************************
+
+import os
+import json
+import numpy as np
+
+# Replay memory state storage dtypes
+STATE_DTYPES = {"float32": np.float32, "float16": np.float16, "int16": np.int16}
+
+class ReplayMemory:
+    def __init__(self, state_size, memory_length, path=None, readonly=False, history_length=1, discounted=False, storage="float32", state_max=2.):
+        if storage not in STATE_DTYPES:
+            raise ValueError("Unknown replay memory storage: {} (use {})".format(storage, ", ".join(sorted(STATE_DTYPES))))
+        self.frame_size = state_size                                        # number of environment state inputs (per frame)
+        self.history_length = history_length                                # number of frames per state (1 = no frame stacking)
+        self.state_size = state_size * history_length                       # number of (stacked) state values
+        self.memory_length = memory_length                                  # size of replay memory (max number of transitions)
+        self.path = path                                                    # directory of memory-mapped array files (None = arrays in RAM)
+        self.readonly = readonly                                            # open memory-mapped files read-only
+        self.storage = storage                                              # state storage ("float32", "float16" or "int16"; 16 bit storage also packs actions and dones)
+        self.state_scale = 32767. / state_max if storage == "int16" else 1.    # int16 state value per state unit
+        dtype = STATE_DTYPES[storage]
+        compact = storage != "float32"
+        if path is not None and not readonly and not os.path.exists(path):
+            os.makedirs(path)
+        if history_length == 1:
+            self.states = self._array("states", (memory_length, state_size), dtype)            # s
+            self.next_states = self._array("next_states", (memory_length, state_size), dtype)  # s'
+        else:
+            self.frames = self._array("frames", (memory_length, state_size), dtype)            # newest frame of s' (or of s, for a head slot)
+            self.depths = self._array("depths", memory_length, np.int32)                        # number of slots back to the head slot (max history_length; 0 = head slot)
+        self.actions = self._array("actions", memory_length, np.uint8 if compact else np.int32)     # a
+        self.rewards = self._array("rewards", memory_length, np.float32)                    # r
+        self.packed = compact                                                               # dones are stored as bits
+        self.dones = self._array("dones", (memory_length + 7) // 8 if compact else memory_length, np.uint8 if compact else np.bool_)  # done (end of episode)
+        self.discounts = self._array("discounts", memory_length, np.float32) if discounted else None    # discount of s' value (None = agent's discount rate)
+        self.index = 0                                                      # next write position in ring buffer
+        self.count = 0                                                      # number of stored transitions (and head slots)
+        self.chain = 0                                                      # depth of the last slot, if the next transition can continue it (0 = no)
+        self._load_position()
+
+    # Preallocated array (in RAM, or a memory-mapped file in path, reopened if it already exists)
+    def _array(self, name, shape, dtype):
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        fname = os.path.join(self.path, name + ".npy")
+        shape = shape if isinstance(shape, tuple) else (shape,)
+        if not os.path.exists(fname):
+            if self.readonly:
+                raise IOError("Replay memory file not found: {}".format(fname))
+            return np.lib.format.open_memmap(fname, mode="w+", dtype=dtype, shape=shape)
+        array = np.lib.format.open_memmap(fname, mode="r" if self.readonly else "r+")
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError("Replay memory file {} has shape {} ({}), expected {} ({})".format(fname, array.shape, array.dtype, shape, np.dtype(dtype)))
+        return array
+
+    # Memory position (and other values not stored in arrays) to save with memory-mapped files
+    def _position(self):
+        return {"index": int(self.index), "count": int(self.count), "chain": int(self.chain)}
+
+    # Restore memory position saved by flush (if any)
+    def _load_position(self):
+        if self.path is None or not os.path.exists(os.path.join(self.path, "memory.json")):
+            return
+        f = open(os.path.join(self.path, "memory.json"))
+        try:
+            position = json.load(f)
+        finally:
+            f.close()
+        for name, value in position.items():
+            setattr(self, str(name), value)
+
+    # Write memory-mapped arrays and the memory position to disk (does nothing for memory in RAM)
+    def flush(self):
+        if self.path is None or self.readonly:
+            return
+        for array in self._arrays():
+            array.flush()
+        fname = os.path.join(self.path, "memory.json")
+        f = open(fname + ".tmp", "w")
+        try:
+            json.dump(self._position(), f)
+        finally:
+            f.close()
+        os.rename(fname + ".tmp", fname)
+
+    def _arrays(self):
+        if self.history_length > 1:
+            arrays = [self.frames, self.depths, self.actions, self.rewards, self.dones]
+        else:
+            arrays = [self.states, self.actions, self.rewards, self.next_states, self.dones]
+        return arrays + ([self.discounts] if self.discounts is not None else [])
+
+    def __len__(self):
+        return self.count
+
+    # Add a [s,a,r,s',done] transition, overwriting the oldest transition once memory is full; returns the memory
+    # indices written (with frame stacking, a head slot may be written before the transition)
+    # discount is the transition's discount of the s' value (only stored if the memory is discounted)
+    def append(self, state, action, reward, next_state, done, discount=None):
+        if self.history_length > 1:
+            return self._append_frames(state, action, reward, next_state, done, discount)
+        i = self.index
+        self.states[i] = self._encode(np.reshape(state, self.state_size))
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = self._encode(np.reshape(next_state, self.state_size))
+        self._set_dones(i, done)
+        if self.discounts is not None:
+            self.discounts[i] = discount
+        self.index = (i + 1) % self.memory_length
+        self.count = min(self.count + 1, self.memory_length)
+        return np.array([i])
+
+    # Add a transition with frame stacking: only the newest frame of next_state is stored (and the newest frame
+    # of state, in a head slot, if state does not continue the last transition's next state)
+    def _append_frames(self, state, action, reward, next_state, done, discount):
+        frame = self._encode(np.reshape(state, (self.history_length, self.frame_size))[-1])
+        indices = []
+        if self.chain == 0 or not np.array_equal(self.frames[(self.index - 1) % self.memory_length], frame):
+            indices.append(self._write_frame(frame, 0))
+            self.chain = 0
+        i = self._write_frame(self._encode(np.reshape(next_state, (self.history_length, self.frame_size))[-1]), min(self.chain + 1, self.history_length))
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self._set_dones(i, done)
+        if self.discounts is not None:
+            self.discounts[i] = discount
+        self.chain = 0 if done else int(self.depths[i])
+        indices.append(i)
+        return np.array(indices)
+
+    # Write an (encoded) frame to the next slot; returns its memory index
+    def _write_frame(self, frame, depth):
+        i = self.index
+        self.frames[i] = frame
+        self.depths[i] = depth
+        self.index = (i + 1) % self.memory_length
+        self.count = min(self.count + 1, self.memory_length)
+        return i
+
+    # Add a batch of transitions (one per row) with vectorized writes; returns their memory indices
+    # (with frame stacking, transitions are added one at a time and the indices of all slots written are returned)
+    def extend(self, states, actions, rewards, next_states, dones, discounts=None):
+        n = len(actions)
+        if self.history_length > 1:
+            discounts = [None] * n if discounts is None else discounts
+            return np.concatenate([self.append(*transition) for transition in zip(states, actions, rewards, next_states, dones, discounts)])
+        indices = (self.index + np.arange(n)) % self.memory_length
+        self.states[indices] = self._encode(np.reshape(states, (n, self.state_size)))
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = self._encode(np.reshape(next_states, (n, self.state_size)))
+        self._set_dones(indices, dones)
+        if self.discounts is not None:
+            self.discounts[indices] = discounts
+        self.index = (self.index + n) % self.memory_length
+        self.count = min(self.count + n, self.memory_length)
+        return indices
+
+    # Sample a minibatch of transition indices (uniformly, with replacement)
+    def sample_indices(self, batch_size):
+        indices = np.random.randint(0, self.count, size=batch_size)
+        if self.history_length > 1:
+            redraw = ~self.sampleable(indices)
+            while redraw.any():
+                indices[redraw] = np.random.randint(0, self.count, size=redraw.sum())
+                redraw = ~self.sampleable(indices)
+        return indices
+
+    # Which memory indices hold transitions that can be sampled (with frame stacking, not head slots, and not
+    # transitions near the oldest slot whose state's frames have been overwritten)
+    def sampleable(self, indices):
+        if self.history_length == 1:
+            return np.ones(len(indices), dtype=np.bool_)
+        oldest = self.index if self.count == self.memory_length else 0
+        depths = self.depths[indices]
+        return (depths > 0) & (depths <= (np.asarray(indices) - oldest) % self.memory_length)
+
+    # Return minibatch arrays (states, actions, rewards, next_states, dones) for the given indices
+    def get(self, indices):
+        if self.history_length > 1:
+            states, next_states = self._stacked_states(np.asarray(indices))
+            return (states, self.actions[indices], self.rewards[indices], next_states, self._get_dones(indices))
+        return (self._decode(self.states[indices]), self.actions[indices], self.rewards[indices],
+                self._decode(self.next_states[indices]), self._get_dones(indices))
+
+    # Rebuild stacked states and next states (oldest frame first) from the frame slots before each transition
+    # (slots before a transition's head slot are replaced by the head slot)
+    def _stacked_states(self, indices):
+        depths = self.depths[indices][:, None]
+        back = np.arange(self.history_length - 1, -1, -1)     # slots back from the newest frame, for each frame of a state
+        next_slots = (indices[:, None] - np.minimum(back, depths)) % self.memory_length
+        slots = (indices[:, None] - 1 - np.minimum(back, depths - 1)) % self.memory_length
+        shape = (len(indices), self.state_size)
+        return np.reshape(self._decode(self.frames[slots]), shape), np.reshape(self._decode(self.frames[next_slots]), shape)
+
+    # States (or frames) in the storage dtype (int16 states are scaled, rounded and clipped)
+    def _encode(self, states):
+        if self.storage == "int16":
+            return np.clip(np.rint(np.multiply(states, self.state_scale)), -32767, 32767).astype(np.int16)
+        return np.asarray(states, dtype=STATE_DTYPES[self.storage])
+
+    # Stored states (or frames) decoded to float32
+    def _decode(self, states):
+        if self.storage == "int16":
+            return np.multiply(states, np.float32(1. / self.state_scale), dtype=np.float32)
+        return np.asarray(states, dtype=np.float32)
+
+    # Set the done flags of memory indices (bit i % 8 of byte i // 8, if packed)
+    def _set_dones(self, indices, dones):
+        if not self.packed:
+            self.dones[indices] = dones
+            return
+        indices, dones = np.broadcast_arrays(np.atleast_1d(indices), np.asarray(dones, dtype=np.bool_))
+        indices, dones = indices[-self.memory_length:], dones[-self.memory_length:]     # only the last write to each index is kept
+        byte, bits = indices >> 3, np.left_shift(1, indices & 7).astype(np.uint8)
+        np.bitwise_and.at(self.dones, byte, ~bits)
+        np.bitwise_or.at(self.dones, byte[dones], bits[dones])
+
+    # Done flags of memory indices (as bools)
+    def _get_dones(self, indices):
+        if not self.packed:
+            return self.dones[indices]
+        indices = np.asarray(indices)
+        return ((self.dones[indices >> 3] >> (indices & 7)) & 1).astype(np.bool_)
+
+    # Discounts of the s' values for sampled indices (None if not stored, i.e., the agent's discount rate is used)
+    def discount_factors(self, indices):
+        if self.discounts is None:
+            return None
+        return self.discounts[indices]
+
+    # Sample a minibatch and return it as ready-to-feed arrays
+    def sample(self, batch_size):
+        return self.get(self.sample_indices(batch_size))
+
+    # Reset replay memory to empty (preallocated arrays are kept and overwritten)
+    def clear(self):
+        self.index = 0
+        self.count = 0
+        self.chain = 0
+
+    # Importance-sampling weights for sampled indices (not required for uniform sampling)
+    def importance_weights(self, indices):
+        return None
+
+    # Write counts of sampled indices, to be given back to update_priorities (not required for uniform sampling)
+    def write_counts(self, indices):
+        return None
+
+    # Update sampling priorities from TD errors (not required for uniform sampling)
+    def update_priorities(self, indices, td_errors, writes=None):
+        pass
+
+
+# Sum-tree (binary heap array) of priorities: each internal node holds the sum of its children,
+# so the root is the total priority. Finding the leaf for a cumulative priority value, and
+# updating a leaf, are both O(log n) and are vectorized over a whole minibatch.
+# The number of leaves is rounded up to a power of 2 so that all leaves are at the same depth
+# (unused leaves keep a priority of 0 and are never sampled).
+# A preallocated tree array (e.g., memory-mapped) can be given, so the priorities can be kept with the memory.
+class SumTree:
+    def __init__(self, size, tree=None):
+        self.capacity = 1 << max(size - 1, 0).bit_length()         # number of leaves (one per memory slot)
+        self.tree = np.zeros(2 * self.capacity - 1, dtype=np.float64) if tree is None else tree  # leaves are at [capacity-1, 2*capacity-1)
+
+    # Number of tree array values needed for size leaves
+    @staticmethod
+    def tree_size(size):
+        return 2 * (1 << max(size - 1, 0).bit_length()) - 1
+
+    def total(self):
+        return self.tree[0]
+
+    # Return leaf priorities for memory indices
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.capacity - 1]
+
+    # Set leaf priorities for memory indices and propagate the change up to the root
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.capacity - 1
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes)
+        while nodes[0] > 0:
+            nodes = np.unique((nodes - 1) // 2)
+            self.tree[nodes] = self.tree[2 * nodes + 1] + self.tree[2 * nodes + 2]
+
+    # Find the memory index whose cumulative priority range contains each value
+    def find(self, values):
+        nodes = np.zeros(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.capacity - 1:
+            left = 2 * nodes + 1
+            go_right = values > self.tree[left]
+            values = np.where(go_right, values - self.tree[left], values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - (self.capacity - 1)
+
+
+# Prioritized replay memory: transitions are sampled proportional to (|TD error| + eps)^alpha
+# and importance-sampling weights (annealed by beta towards 1) correct for the sampling bias
+class PrioritizedReplayMemory(ReplayMemory):
+    def __init__(self, state_size, memory_length, path=None, readonly=False, history_length=1, discounted=False, storage="float32", state_max=2., alpha=.6, beta=.4, beta_increment=.00001, eps=.01):
+        self.alpha = alpha                          # priority exponent (0 = uniform sampling)
+        self.beta = beta                            # importance-sampling exponent (annealed to 1)
+        self.beta_increment = beta_increment        # increase in beta per sampled minibatch
+        self.eps = eps                              # small constant so no transition has zero priority
+        self.max_priority = 1.0                     # priority given to new transitions (so each is replayed at least once)
+        ReplayMemory.__init__(self, state_size, memory_length, path, readonly, history_length, discounted, storage, state_max)
+        self.writes = np.zeros(memory_length, dtype=np.uint32)     # number of times each slot has been written (wraps around)
+        self.tree = SumTree(memory_length, self._array("priorities", SumTree.tree_size(memory_length), np.float64))
+
+    def append(self, state, action, reward, next_state, done, discount=None):
+        indices = ReplayMemory.append(self, state, action, reward, next_state, done, discount)
+        self._prioritize_new(indices)
+        return indices
+
+    def extend(self, states, actions, rewards, next_states, dones, discounts=None):
+        indices = ReplayMemory.extend(self, states, actions, rewards, next_states, dones, discounts)
+        self._prioritize_new(indices)
+        return indices
+
+    # Give new transitions the max priority, so each is replayed at least once (head slots get 0)
+    # With frame stacking, transitions near the oldest slot of a full memory whose state's frames have been
+    # overwritten get 0 too
+    def _prioritize_new(self, indices):
+        np.add.at(self.writes, indices, 1)
+        if self.history_length == 1:
+            self.tree.update(indices, self.max_priority)
+            return
+        self.tree.update(indices, np.where(self.sampleable(indices), self.max_priority, 0.))
+        if self.count == self.memory_length:
+            oldest = (self.index + np.arange(self.history_length)) % self.memory_length
+            self.tree.update(oldest, np.where(self.sampleable(oldest), self.tree.get(oldest), 0.))
+
+    # Stratified sampling: one index from each of batch_size equal slices of the total priority
+    def sample_indices(self, batch_size):
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + np.random.rand(batch_size)) * segment
+        indices = np.minimum(self.tree.find(np.minimum(values, self.tree.total() * (1 - 1e-12))), self.count - 1)
+        if self.history_length > 1:
+            redraw = ~self.sampleable(indices)
+            while redraw.any():
+                values = np.random.rand(redraw.sum()) * self.tree.total() * (1 - 1e-12)
+                indices[redraw] = np.minimum(self.tree.find(values), self.count - 1)
+                redraw = ~self.sampleable(indices)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return indices
+
+    # Importance-sampling weights (N * P(i))^-beta, normalized by the largest weight in the minibatch
+    def importance_weights(self, indices):
+        probs = self.tree.get(indices) / self.tree.total()
+        weights = (self.count * probs) ** -self.beta
+        return weights / weights.max()
+
+    def write_counts(self, indices):
+        return self.writes[indices]
+
+    # Only indices that can still be sampled, and (if the write counts they were sampled with are given) that have
+    # not been written since they were sampled, are updated: e.g., with a learner thread, slots can be overwritten
+    # (or lose their state's frames) while the minibatch is being trained
+    def update_priorities(self, indices, td_errors, writes=None):
+        keep = self.sampleable(indices)
+        if writes is not None:
+            keep &= self.writes[indices] == writes
+        if not keep.any():
+            return
+        priorities = (np.abs(np.asarray(td_errors)[keep]) + self.eps) ** self.alpha
+        self.tree.update(np.asarray(indices)[keep], priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def clear(self):
+        ReplayMemory.clear(self)
+        self.tree.tree[:] = 0
+        self.max_priority = 1.0
+
+    def _position(self):
+        position = ReplayMemory._position(self)
+        position.update(beta=float(self.beta), max_priority=float(self.max_priority))
+        return position
+
+    def _arrays(self):
+        return ReplayMemory._arrays(self) + [self.tree.tree]
+
+
+# n-step transition builder (one per game, or player): turns the 1-step transitions of a game, added in the order
+# they happen, into n-step transitions [s_t, a_t, R_t, s_t+n, done, gamma^n], where the n-step return
+# R_t = r_t + gamma r_t+1 + ... + gamma^(n-1) r_t+n-1 is accumulated as each reward is added, in a fixed-size
+# window (ring buffer) of the last n transitions. A transition is complete once n rewards have been added, or
+# at the end of an episode (then with fewer rewards, a smaller discount, and done)
+class NStepBuilder:
+    def __init__(self, n, gamma, state_size):
+        self.n = n                                                          # number of steps (rewards) per transition
+        self.gamma = gamma                                                  # discount rate
+        self.states = np.zeros((n, state_size), dtype=np.float32)          # s of pending transitions
+        self.actions = np.zeros(n, dtype=np.int32)                          # a of pending transitions
+        self.returns = np.zeros(n)                                          # discounted return so far of pending transitions
+        self.discounts = np.ones(n)                                         # gamma^k (for k rewards added so far) of pending transitions
+        self.start = 0                                                      # window position of the oldest pending transition
+        self.size = 0                                                       # number of pending transitions
+
+    # Add a [s,a,r,s',done] transition; returns the completed n-step transitions [s,a,R,s',done,discount]
+    # (the returned states are views of the window, valid until the next add)
+    def add(self, state, action, reward, next_state, done):
+        i = (self.start + self.size) % self.n
+        self.states[i] = np.reshape(state, -1)
+        self.actions[i] = action
+        self.returns[i] = 0.
+        self.discounts[i] = 1.
+        self.size += 1
+        pending = (self.start + np.arange(self.size)) % self.n
+        self.returns[pending] += self.discounts[pending] * reward
+        self.discounts[pending] *= self.gamma
+        if done:
+            completed = pending
+        elif self.size == self.n:
+            completed = pending[:1]
+        else:
+            return []
+        self.start = (self.start + len(completed)) % self.n
+        self.size -= len(completed)
+        return [(self.states[j], self.actions[j], self.returns[j], next_state, done, self.discounts[j]) for j in completed]
@@ -0,0 +1,126 @@
+# *****************************************************************************
+#
+# Multi-Agent Coordinator for DQN Agents Playing Unity Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# An AgentGroup steps N agents (e.g., the two paddles in Pong) together, rather
+# than one agent after another:
+#   replay: each agent's minibatch is trained in its own worker thread (Keras
+#           releases the GIL while TensorFlow runs), so the agents train at the
+#           same time.
+#   act:    the actions for all agents are chosen with one batched (stacked
+#           weights) numpy forward pass, if all agents use fast inference and
+#           have the same network shape (otherwise each agent acts in turn).
+# Each agent keeps its own model, replay memory and epsilon schedule.
+# The same agent can be given for more than one player (e.g., self-play, where
+# both paddles share one network and one replay memory): a shared agent is only
+# trained (replay and target model updates) once per step, and if all players
+# share one agent, their actions are chosen with one batched act call.
+#
+# *****************************************************************************
+
+import random
+import threading
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+class AgentGroup:
+    def __init__(self, agents, trainers=None, parallel=True):
+        self.agents = list(agents)                  # agents (DDQN_Agent) stepped together
+        trainers = list(trainers) if trainers is not None else self.agents
+        self.learners = []                          # (agent, trainer) of each different agent (a shared agent is trained once)
+        for agent, trainer in zip(self.agents, trainers):
+            if not any(agent is a for a, t in self.learners):
+                self.learners.append((agent, trainer))
+        self.trainers = [t for a, t in self.learners]  # trainer (agent or Learner) of each different agent
+        self.shared = len(self.learners) == 1 and len(self.agents) > 1     # all players are driven by one shared agent
+        self.fused = None                           # act with one batched forward pass (checked on first act)
+        self.stacked_weights = None                 # agents' act weights the stacked weights were made from
+        self.stacked = None                         # act weights of all agents, stacked (one row per agent)
+        self.results = queue.Queue()                # results (None or error) of jobs done by worker threads
+        self.jobs = []                              # job queue for each worker thread (agents 2 to N; agent 1 uses the calling thread)
+        if parallel:
+            for agent, trainer in self.learners[1:]:
+                jobs = queue.Queue()
+                worker = threading.Thread(target=self._work, args=(agent, jobs))
+                worker.daemon = True
+                worker.start()
+                self.jobs.append(jobs)
+
+    # Worker thread: run jobs for an agent (in the agent's graph) until stopped
+    def _work(self, agent, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            try:
+                with agent.graph.as_default():
+                    job()
+                self.results.put(None)
+            except Exception as e:
+                self.results.put(e)
+
+    # Run one job per agent (at the same time, if parallel) and wait for all of them to finish
+    def _run(self, jobs):
+        if not self.jobs:
+            for job in jobs:
+                job()
+            return
+        for worker_jobs, job in zip(self.jobs, jobs[1:]):
+            worker_jobs.put(job)
+        error = None
+        try:
+            jobs[0]()
+        except Exception as e:
+            error = e
+        for i in range(len(jobs) - 1):
+            result = self.results.get()
+            error = error or result
+        if error is not None:
+            raise error
+
+    # Action Replay Process for all agents (each agent trains on its own replay memory)
+    def replay(self, batch_size, delay_count):
+        self._run([lambda trainer=trainer: trainer.replay(batch_size, delay_count) for trainer in self.trainers])
+
+    # Update all agents' target models
+    def update_target_model(self):
+        for trainer in self.trainers:
+            trainer.update_target_model()
+
+    # Act in a epsilon-greedy manner for all agents (one state per agent); returns a list of actions
+    def act(self, states):
+        if self.shared:
+            return list(self.agents[0].act_batch(np.vstack(states)))
+        if self.fused is None:
+            shapes = [[w.shape for w in agent.act_model_weights()] for agent in self.agents]
+            self.fused = all(agent.fast_inference for agent in self.agents) and all(s == shapes[0] for s in shapes)
+        if not self.fused:
+            return [agent.act(state) for agent, state in zip(self.agents, states)]
+        actions = np.argmax(self.q_values(states), axis=1)
+        for i, agent in enumerate(self.agents):
+            if np.random.rand() <= agent.epsilon:
+                actions[i] = random.randrange(agent.action_size)
+        return list(actions)
+
+    # Q values of all agents' act models (one state per agent) with one batched forward pass
+    # The stacked weights are only rebuilt after an agent's act weights have changed
+    def q_values(self, states):
+        weights = [agent.act_model_weights() for agent in self.agents]
+        if self.stacked_weights is None or any(w is not s for w, s in zip(weights, self.stacked_weights)):
+            self.stacked_weights = weights
+            self.stacked = [np.stack(layer) for layer in zip(*weights)]
+        w = self.stacked
+        x = np.asarray([np.reshape(state, -1) for state in states], dtype=np.float32)[:, None, :]
+        for i in range(0, len(w) - 2, 2):
+            x = np.maximum(np.matmul(x, w[i]) + w[i + 1][:, None, :], 0)   # hidden layers (relu)
+        return (np.matmul(x, w[-2]) + w[-1][:, None, :])[:, 0, :]            # output layer (linear)
+
+    # Stop worker threads
+    def stop(self):
+        for worker_jobs in self.jobs:
+            worker_jobs.put(None)
+        self.jobs = []
@@ -0,0 +1,172 @@
+# *****************************************************************************
+#
+# Pure NumPy Q-Network (MLP) for DQN Agents Playing Unity Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# A drop-in replacement for the Keras Sequential model built by DDQN_Agent
+# (Dense relu hidden layers, linear output, MSE loss, Adam optimizer) that does
+# not import Keras or TensorFlow. Only the parts of the Keras model API used by
+# the agent are provided (predict, fit, get/set_weights, load/save_weights).
+# Weights files use the Keras save_weights (HDF5) layout, so weights can be
+# loaded from and saved to the same .h5 files as the Keras model. The Adam
+# optimizer weights use the same order as the Keras optimizer weights.
+#
+# *****************************************************************************
+
+import h5py
+import numpy as np
+from Checkpoint import write_weights
+
+class NumpyMLP:
+    def __init__(self, input_dim, hidden_units, output_dim, learning_rate):
+        sizes = [input_dim] + list(hidden_units) + [output_dim]
+        self.layers = [DenseLayer("dense_" + str(i + 1)) for i in range(len(sizes) - 1)]
+        self.weights = []                           # flat list of [kernel, bias] arrays for each layer
+        for i in range(len(sizes) - 1):
+            if i == 1:
+                kernel = np.random.uniform(-.05, .05, (sizes[i], sizes[i + 1]))    # kernel_initializer='uniform'
+            else:
+                limit = np.sqrt(6. / (sizes[i] + sizes[i + 1]))                     # glorot_uniform (Keras default)
+                kernel = np.random.uniform(-limit, limit, (sizes[i], sizes[i + 1]))
+            self.weights += [kernel.astype(np.float32), np.zeros(sizes[i + 1], dtype=np.float32)]
+        self.optimizer = Adam(self.weights, learning_rate)    # optimizer (as Keras model.optimizer)
+
+    # Forward pass; returns output and (if keep) the activations of each layer
+    def _forward(self, x, keep=False):
+        activations = [np.asarray(x, dtype=np.float32)]
+        w = self.weights
+        for i in range(0, len(w), 2):
+            x = np.dot(activations[-1], w[i]) + w[i + 1]
+            if i < len(w) - 2:
+                x = np.maximum(x, 0)
+            activations.append(x)
+        return activations if keep else activations[-1]
+
+    def predict(self, x, batch_size=32, verbose=0):
+        return self._forward(x)
+
+    # Train for a number of epochs of minibatches (shuffled), with one Adam update per minibatch
+    def fit(self, x, y, batch_size=32, epochs=1, verbose=0, sample_weight=None, shuffle=True):
+        x = np.asarray(x, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        for epoch in range(epochs):
+            order = np.random.permutation(len(x)) if shuffle else np.arange(len(x))
+            for start in range(0, len(x), batch_size):
+                batch = order[start:start + batch_size]
+                weights = None if sample_weight is None else np.asarray(sample_weight)[batch]
+                self.train_on_batch(x[batch], y[batch], weights)
+
+    # One Adam update on the (sample weighted) mean squared error of a minibatch
+    # Loss is computed as in Keras: mean over outputs, weighted per sample, mean over samples
+    # (divided by the fraction of non-zero sample weights)
+    def train_on_batch(self, x, y, sample_weight=None):
+        activations = self._forward(x, keep=True)
+        error = activations[-1] - y
+        scale = 2. / error.size
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight, dtype=np.float32)
+            scale = scale * sample_weight[:, None] / max(np.mean(sample_weight != 0), 1e-7)
+        delta = (error * scale).astype(np.float32)
+        grads = [None] * len(self.weights)
+        for i in range(len(self.weights) - 2, -1, -2):
+            grads[i] = np.dot(activations[i // 2].T, delta)
+            grads[i + 1] = delta.sum(axis=0)
+            if i > 0:
+                delta = np.dot(delta, self.weights[i].T) * (activations[i // 2] > 0)
+        self.optimizer.update(self.weights, grads)
+
+    def get_weights(self):
+        return [w.copy() for w in self.weights]
+
+    def set_weights(self, weights):
+        for w, new in zip(self.weights, weights):
+            w[...] = new
+
+    # Load weights from a Keras save_weights (HDF5) file
+    def load_weights(self, fname):
+        f = h5py.File(fname, "r")
+        try:
+            weights = []
+            for name in f.attrs["layer_names"]:
+                g = f[to_str(name)]
+                weights += [g[to_str(w)][()] for w in g.attrs["weight_names"]]
+        finally:
+            f.close()
+        if len(weights) != len(self.weights):
+            raise ValueError("Weights file {} has {} weight arrays, model has {}".format(fname, len(weights), len(self.weights)))
+        self.set_weights(weights)
+
+    # Save weights to a Keras save_weights (HDF5) file
+    def save_weights(self, fname):
+        layout = [(layer.name, [w.name for w in layer.weights]) for layer in self.layers]
+        write_weights(fname, layout, self.weights)
+
+    # Keras model functions are built lazily; nothing to build for the numpy model
+    def _make_predict_function(self):
+        pass
+
+    def _make_train_function(self):
+        pass
+
+
+# Adam optimizer (same update and default parameters as the Keras Adam optimizer)
+# Optimizer weights are [iterations] + 1st moment estimates + 2nd moment estimates (as in Keras)
+class Adam:
+    def __init__(self, weights, lr, beta_1=.9, beta_2=.999, epsilon=1e-8):
+        self.lr = lr                                # learning rate
+        self.beta_1 = beta_1                        # exponential decay rate for 1st moment estimates
+        self.beta_2 = beta_2                        # exponential decay rate for 2nd moment estimates
+        self.epsilon = epsilon                      # fuzz factor
+        self.iterations = 0                         # number of updates
+        self.m = [np.zeros_like(w) for w in weights]    # 1st moment estimates
+        self.v = [np.zeros_like(w) for w in weights]    # 2nd moment estimates
+
+    # Update weights (in place) from their loss gradients
+    def update(self, weights, grads):
+        self.iterations += 1
+        t = self.iterations
+        lr_t = self.lr * np.sqrt(1. - self.beta_2 ** t) / (1. - self.beta_1 ** t)
+        for w, g, m, v in zip(weights, grads, self.m, self.v):
+            m *= self.beta_1
+            m += (1. - self.beta_1) * g
+            v *= self.beta_2
+            v += (1. - self.beta_2) * np.square(g)
+            w -= (lr_t * m / (np.sqrt(v) + self.epsilon)).astype(np.float32)
+
+    def get_weights(self):
+        return [np.array(self.iterations, dtype=np.float32)] + [m.copy() for m in self.m] + [v.copy() for v in self.v]
+
+    def set_weights(self, weights):
+        n = len(self.m)
+        self.iterations = int(weights[0])
+        for m, new in zip(self.m, weights[1:n + 1]):
+            m[...] = new
+        for v, new in zip(self.v, weights[n + 1:]):
+            v[...] = new
+
+
+# Layer and weight names (as used in Keras weights files)
+class DenseLayer:
+    def __init__(self, name):
+        self.name = name
+        self.weights = [WeightName(name + "/kernel:0"), WeightName(name + "/bias:0")]
+
+class WeightName:
+    def __init__(self, name):
+        self.name = name
+
+
+# Stand-in for a TensorFlow graph (the numpy model can be used in any thread)
+class NullGraph:
+    def as_default(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def to_str(name):
+    return name.decode("utf8") if isinstance(name, bytes) else name
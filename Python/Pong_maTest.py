@@ -24,6 +24,8 @@ import numpy as np
 # **************************************************************************
 # Import DDQN_Agent from Agent
 from Agent import DDQN_Agent as unityAgent
+from UnityLink import get_protocol, FrameReceiver
+from SimGames import SimConnection, PongSim
 
 
 # **************************************************************************
@@ -32,40 +34,50 @@ num_episods = 20	# number of episodes used for training
 state_size = 6		# set environment state size (wallPong: ball x, ball y, ball x velocity, ball y velocity, paddle y)
 action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up; 2=down)
 pframe = 4			# specifies frame downsample factor (i.e., process action only every n frames)
+protocol = "text"	# Unity wire protocol ("text" = space-separated ASCII, "binary" = fixed-size packed float32/int32 records)
+frame_policy = "all"	# process every received game frame in order ("all") or only the most recent queued frame and any frames with a reward or done ("latest")
+game_source = "unity"	# play the Unity game over TCP ("unity") or an in-process simulated game ("sim")
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
 
 
 # **************************************************************************
-# Initiate agents and agent variables
-agent1 = unityAgent(state_size, action_size, 0, 0, .1, 0, 0, 0, 0)	# hyperparameters set to zero for testing, epsilon = .1
-a1_newstate = np.reshape([0,0,0,0,0,0], [1, state_size])			# Initialize new game state cache (array)
-agent1.load("./pong_a1_twEx.h5") 			# Load network weights for agent 1
-
-agent2 = unityAgent(state_size, action_size, 0, 0, .1, 0, 0, 0, 0)	# hyperparameters set to zero for testing, epsilon = .1
-a2_newstate = np.reshape([0,0,0,0,0,0], [1, state_size])			# Initialize new game state cache (array)
-agent2.load("./pong_a2_twEx.h5") 			# Load network weights for agent 2
-
+# Initialize wire protocol for game messages (6 floats and 3 integers in, reset and 2 action(s) out)
+wire = get_protocol(protocol, 6, 3, 2)
 
 # **************************************************************************
-# Create a TCP/IP socket
+# Create a TCP/IP socket (bound before the agent is built, so a game can connect straight away)
 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)   # Initialize TCP socket
 server_address = ('localhost', 10000)					 # Set TCP server address
 sock.bind(server_address)								 # Bind the TCP socket address to the port
 print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
 sock.listen(1)										 # Listen for incoming connections
 
+# **************************************************************************
+# Initiate agents and agent variables
+agent1 = unityAgent(state_size, action_size, 0, 0, .1, 0, 0, 0, 0, backend=backend, background_build=True)	# hyperparameters set to zero for testing, epsilon = .1
+a1_newstate = np.reshape([0,0,0,0,0,0], [1, state_size])			# Initialize new game state cache (array)
+agent1.load("./pong_a1_twEx.h5") 			# Load network weights for agent 1
+
+agent2 = unityAgent(state_size, action_size, 0, 0, .1, 0, 0, 0, 0, backend=backend, background_build=True)	# hyperparameters set to zero for testing, epsilon = .1
+a2_newstate = np.reshape([0,0,0,0,0,0], [1, state_size])			# Initialize new game state cache (array)
+agent2.load("./pong_a2_twEx.h5") 			# Load network weights for agent 2
 
 # **************************************************************************
 # Main While loop to run DDQN RL process
 # First, waits for clinet connection from unity game
 # Once clinet connects, 
 while True:
-	# Wait for a connection
-	print('waiting for a connection')
-	connection, client_address = sock.accept()
+	# Wait for a connection (or connect to an in-process simulated game)
+	if game_source == "sim":
+		connection, client_address = SimConnection(PongSim(), wire), "simulated game"
+	else:
+		print('waiting for a connection')
+		connection, client_address = sock.accept()
 
 	try:
 		# Connection from unity client made
 		print('connection from', client_address)
+		receiver = FrameReceiver(connection, wire, frame_policy)	# buffered receiver returning complete game frames
 
 		# Initialize training and episode varibles
 		fcount = 1				# frame (in data) count
@@ -80,10 +92,10 @@ while True:
 		# send initial rest and action message to game to start game
 		# wallPong game expects two integer values (rest, action)
 		# to rest game, reset = 1, otherwise set reset=0	
-		connection.sendall('1 0 0 ')
+		connection.sendall(wire.encode(1, 0, 0))
 
 		# reset initial (default) message string
-		message = "0 {} {} ".format(a1_action, a2_action)
+		message = wire.encode(0, a1_action, a2_action)
 
 		# Complete training
 		while episode < num_episods+1:
@@ -91,14 +103,11 @@ while True:
 			# Check for new game data
 			# for wallPong incomming game data is a string of 5 floats and 1 integer. 
 			# The data order is as follows: ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle1_y, paddle2_y, reward1, reward2, done
-			data = connection.recv(42)
-			#print('received: %s' % data)
+			data_int = receiver.recv_frame()
+			#print('received: {}'.format(data_int))
 
-			# Process game data if received
-			if data:
-
-            	# Process new game data by first split data into a float array.
-				data_int = map(float, data.split())	
+			# Process game data if received (data_int is None if the game closed the connection)
+			if data_int is not None:
 
 				# Extract and process new game state data (ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle_y)
 				# NOTE 1:   x and y positions sent from unity on normlazied range 0 to 1, where:
@@ -135,7 +144,7 @@ while True:
 					a2_reward = 0														# rest current a2 reward
 					a1_action = 0														# set a1 action to 0
 					a2_action = 0														# set a12 action to 0
-					message = "1 0 0 "													# set new outgoing message, with game rest
+					message = wire.encode(1, 0, 0)													# set new outgoing message, with game rest
 				
 				else:
 					# Process every n-frames or if game is done (over)
@@ -144,7 +153,7 @@ while True:
 						a2_episode_reward = a2_episode_reward+a2_reward 				# update episode a2 reward
 						a1_action = agent1.act(a1_newstate)								# determine new action from new state data
 						a2_action = agent2.act(a2_newstate)								# determine new action from new state data
-						message = "0 {} {} ".format(a1_action, a2_action)				# set new outgoing message
+						message = wire.encode(0, a1_action, a2_action)				# set new outgoing message
 						a1_reward = 0													# rest current reward
 						a2_reward = 0													# rest current reward
 				
@@ -162,3 +171,8 @@ while True:
 	finally:
 		# Clean up the connection
 		connection.close()
+
+		# A simulated game is only played once (a Unity game can reconnect)
+		if game_source == "sim":
+			sock.close()
+			break
\ No newline at end of file
@@ -26,6 +26,12 @@ import numpy as np
 # **************************************************************************
 # Import DDQN_Agent from Agent
 from Agent import DDQN_Agent as unityAgent
+from Learner import Learner
+from MultiAgent import AgentGroup
+from Checkpoint import CheckpointManager
+from Profiler import PhaseTimer
+from UnityLink import get_protocol, FrameReceiver, mirror_velocity
+from SimGames import SimConnection, PongSim
 
 
 # **************************************************************************
@@ -36,19 +42,70 @@ action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up;
 reply_size = 28 	# size of action replay minibatch
 targ_update = 2000	# specifies when the target model is updated, i.e., every n frames
 pframe = 4			# specifies frame downsample factor (i.e., process action only every n frames)
+prioritized = False	# use prioritized experience replay (sample transitions proportional to TD error)
+async_learning = False	# train in a background learner thread (the game loop only acts and remembers)
+train_every = 1		# train the agent's NN every n replay calls (i.e., every n decision steps; 1 = every decision step)
+gradient_steps = 1	# number of minibatches (gradient steps) trained per training step (sampled in one go and trained with one fit call)
+n_step = 1			# number of rewards per remembered transition (n-step returns, bootstrapped from the state n decision steps later; 1 = 1-step)
+tau = None			# soft (Polyak) target model update rate per training step, e.g., .005 (None = copy weights to the target model every targ_update frames)
+replay_storage = "float32"	# replay memory state storage ("float32", or compact "float16" or "int16" = scaled 16 bit integers, which also store actions as bytes and done flags as bits: about half the memory per transition)
+ckpt_every = 1		# save agent's NN weights every n episodes (0 = never)
+ckpt_keep = 10		# number of most recent episode weights files kept (0 = keep all)
+ckpt_best = True	# also save NN weights for the best episode reward (as *_best.h5)
+protocol = "text"	# Unity wire protocol ("text" = space-separated ASCII, "binary" = fixed-size packed float32/int32 records)
+frame_policy = "all"	# process every received game frame in order ("all") or only the most recent queued frame and any frames with a reward or done ("latest")
+game_source = "unity"	# play the Unity game over TCP ("unity") or an in-process simulated game ("sim")
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+replay_dir = None	# directory for memory-mapped replay memory files, kept after training so training can be resumed with the same memory (None = memory in RAM, erased after training)
+snapshot_dir = None	# directory for training state snapshots (weights, target model, optimizer, epsilon, frame and episode counts), saved every episode; training resumes from them if they exist (None = no snapshots)
+parallel_agents = True	# train both agents at the same time (in separate threads) rather than one after the other
+self_play = False	# both paddles are driven by one shared agent (one network and one replay memory); paddle 2's state is mirrored so it sees the game as paddle 1 does
+profile = False		# time each phase of the training loop (recv, parse, remember, replay, act, send, ...) and save stats to profileData_*.csv
+profile_every = 10	# print and save profile stats (per-phase times, histograms and frames per second) every n episodes
 
 
+# **************************************************************************
+# Initialize wire protocol for game messages (6 floats and 3 integers in, reset and 2 action(s) out)
+wire = get_protocol(protocol, 6, 3, 2)
+
+# **************************************************************************
+# Create a TCP/IP socket (bound before the agent is built, so a game can connect straight away)
+sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
+server_address = ('localhost', 10000)					 # Set TCP server address
+sock.bind(server_address)								 # Bind the TCP socket address to the port
+print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
+sock.listen(1)											 # Listen for incoming connections
+
 # **************************************************************************
 # Initiate agents and agent variables
-agent1 = unityAgent(state_size, action_size, .99, .0005, 1.0, .9999, .05, 25000, 200000)				# Initialize agent
+agent1 = unityAgent(state_size, action_size, .99, .0005, 1.0, .9999, .05, 25000, 200000, prioritized, backend=backend, background_build=True, memory_path=replay_dir and replay_dir + "/a1", train_every=train_every, gradient_steps=gradient_steps, n_step=n_step, tau=tau, replay_storage=replay_storage)				# Initialize agent
+trainer1 = Learner(agent1, reply_size, targ_update // pframe) if async_learning else agent1	# trains agent (replay and target model updates)
 a1_newstate = np.reshape([0,0,0,0,0,0], [1, state_size])		# Initialize new game state cache (array)
 a1_oldstate = np.reshape([0,0,0,0,0,0], [1, state_size])		# Initialize old game state cache (array)
 #agent1.load("./maWData_20170725_170303/a1w_ep784.h5") 				# If pre-loading network weights, do that here
 
-agent2 = unityAgent(state_size, action_size, .99, .0005, 1.0, .9999, .05, 25000, 200000)				# Initialize agent
+if self_play:
+	agent2, trainer2 = agent1, trainer1											# paddle 2 is driven by agent 1 (shared network and replay memory)
+else:
+	agent2 = unityAgent(state_size, action_size, .99, .0005, 1.0, .9999, .05, 25000, 200000, prioritized, backend=backend, background_build=True, memory_path=replay_dir and replay_dir + "/a2", train_every=train_every, gradient_steps=gradient_steps, n_step=n_step, tau=tau, replay_storage=replay_storage)				# Initialize agent
+	trainer2 = Learner(agent2, reply_size, targ_update // pframe) if async_learning else agent2	# trains agent (replay and target model updates)
 a2_newstate = np.reshape([0,0,0,0,0,0], [1, state_size])		# Initialize new game state cache (array)
 a2_oldstate = np.reshape([0,0,0,0,0,0], [1, state_size])		# Initialize old game state cache (array)
 #agent2.load("./maWData_20170725_170303/a1w_ep784.h5") 					# If pre-loading network weights, do that here
+if snapshot_dir is not None and not os.path.exists(snapshot_dir):
+	os.makedirs(snapshot_dir)
+fcount_start, episode_start = 1, 1						# frame and episode counts training starts from
+if snapshot_dir is not None and os.path.exists(snapshot_dir + "/a1snapshot.h5"):
+	counters = agent1.load_snapshot(snapshot_dir + "/a1snapshot.h5")	# resume training from last training state snapshots
+	if not self_play:
+		agent2.load_snapshot(snapshot_dir + "/a2snapshot.h5")
+	fcount_start, episode_start = counters["fcount"], counters["episode"]
+	print("Resuming training from episode {} (frame {})".format(episode_start, fcount_start))
+if async_learning:
+	trainer1.start()
+	if not self_play:
+		trainer2.start()
+agents = AgentGroup([agent1, agent2], [trainer1, trainer2], parallel_agents)	# steps both agents together (replay, act and target model updates; a shared agent is trained once)
 
 
 # **************************************************************************
@@ -58,6 +115,11 @@ wfiledir = "./maWData_" + timestr
 if not os.path.exists(wfiledir):
     os.makedirs(wfiledir)
 
+# **************************************************************************
+# Initialize checkpoint manager(s) (NN weights files are written by a background thread)
+a1ckpt = CheckpointManager(agent1, wfiledir + "/a1w", ckpt_every, ckpt_keep, ckpt_best)
+a2ckpt = CheckpointManager(agent2, wfiledir + "/a2w", 0 if self_play else ckpt_every, ckpt_keep, ckpt_best and not self_play)	# (saves nothing in self-play)
+
 
 # **************************************************************************
 # Initialize episode/training data file (for post-training analysis)
@@ -66,13 +128,20 @@ episodeDFile = open(episodeDfname, "w")
 episodeDFile.write("Episode, Frame, A1 Epsilon, A2 Epsilon, A1 Episode Reward, A2 Episode Reward\n")
 
 
+# **************************************************************************
+# Initialize per-phase timer (profiling) and profile data file (stats are saved every profile_every episodes)
+profileDfname = wfiledir + "/profileData_" + timestr + ".csv"
+prof = PhaseTimer(profileDfname, profile)
+
+
 # **************************************************************************
 # Save agent parameters
 a1Dfname = wfiledir + "/a1Parameters" + timestr + ".txt"		
 agent1.save_agent_parameters(a1Dfname)
 
-a2Dfname = wfiledir + "/a2Parameters" + timestr + ".txt"		
-agent2.save_agent_parameters(a2Dfname)
+if not self_play:
+	a2Dfname = wfiledir + "/a2Parameters" + timestr + ".txt"		
+	agent2.save_agent_parameters(a2Dfname)
 
 
 # **************************************************************************
@@ -84,34 +153,30 @@ tDfile.write("State size: " + str(state_size) + "\n")
 tDfile.write("Action size: " + str(action_size) + "\n")
 tDfile.write("Reply size: " + str(reply_size) + "\n")
 tDfile.write("Frame downsample factor: " + str(pframe) + "\n")
+tDfile.write("Wire protocol: " + protocol + "\n")
+tDfile.write("Self-play: " + str(self_play) + "\n")
 tDfile.close()
 
-
-# **************************************************************************
-# Create a TCP/IP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
-server_address = ('localhost', 10000)					 # Set TCP server address
-sock.bind(server_address)								 # Bind the TCP socket address to the port
-print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
-sock.listen(1)											 # Listen for incoming connections
-
-
 # **************************************************************************
 # Main While loop to run DDQN RL process
 # First, waits for clinet connection from unity game
 # Once clinet connects, 
 while True:
-	# Wait for a connection
-	print('waiting for a connection')
-	connection, client_address = sock.accept()
+	# Wait for a connection (or connect to an in-process simulated game)
+	if game_source == "sim":
+		connection, client_address = SimConnection(PongSim(), wire), "simulated game"
+	else:
+		print('waiting for a connection')
+		connection, client_address = sock.accept()
 
 	try:
 		# Connection from unity client made
 		print('connection from', client_address)
+		receiver = FrameReceiver(connection, wire, frame_policy, timer=prof)	# buffered receiver returning complete game frames
 
 		# Initialize training and episode varibles
-		fcount = 1				# frame (in data) count
-		episode = 1				# episode count
+		fcount = fcount_start		# frame (in data) count
+		episode = episode_start		# episode count
 		a1_action = 0			# agent 1 action
 		a2_action = 0			# agent 1 action
 		a1_reward = 0			# reward for agent 1
@@ -122,10 +187,11 @@ while True:
 		# send initial rest and action message to game to start game
 		# wallPong game expects two integer values (rest, action)
 		# to rest game, reset = 1, otherwise set reset=0	
-		connection.sendall('1 0 0 ')
+		connection.sendall(wire.encode(1, 0, 0))
 
 		# reset initial (default) message string
-		message = "0 {} {} ".format(a1_action, a2_action)
+		message = wire.encode(0, a1_action, a2_action)
+		prof.lap()
 
 		# Complete training
 		while episode < num_episods+1:
@@ -133,14 +199,11 @@ while True:
 			# Check for new game data
 			# for wallPong incomming game data is a string of 5 floats and 1 integer. 
 			# The data order is as follows: ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle1_y, paddle2_y, reward1, reward2, done
-			data = connection.recv(42)
-			#print('received: %s' % data)
-
-			# Process game data if received
-			if data:
+			data_int = receiver.recv_frame()
+			#print('received: {}'.format(data_int))
 
-            	# Process new game data by first split data into a float array.
-				data_int = map(float, data.split())	
+			# Process game data if received (data_int is None if the game closed the connection)
+			if data_int is not None:
 
 				# Extract and process new game state data (ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle_y)
 				# NOTE 1:   x and y positions sent from unity on normlazied range 0 to 1, where:
@@ -152,34 +215,51 @@ while True:
 				new_state_data = data_int[0:6]
 				a1_newstate = [new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[4],new_state_data[5]]
 				a1_newstate = np.reshape(a1_newstate, [1, state_size])
-				a2_newstate = [new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[5],new_state_data[4]]
+				# NOTE 4:	in self-play, paddle 2's state is mirrored left to right (x = 1 - x, x velocity reversed), so the shared agent always plays from paddle 1's side
+				#			(the x velocity is field 1; mirror_velocity gives the encoded reversed velocity, using the same encoding as the game, see UnityLink.py)
+				if self_play:
+					a2_newstate = [1-new_state_data[0],mirror_velocity(new_state_data[1])-1,new_state_data[2],new_state_data[3]-1,new_state_data[5],new_state_data[4]]
+				else:
+					a2_newstate = [new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[5],new_state_data[4]]
 				a2_newstate = np.reshape(a2_newstate, [1, state_size])
 
 				# Extract reward (last value in game data) and whether current game episdoe is done (over) or not
-				# NOTE 4: rewards sent as positive intergers, which are processed here as: 0=-1, 1=0, 2=1
+				# NOTE 5: rewards sent as positive intergers, which are processed here as: 0=-1, 1=0, 2=1
 				a1_reward = a1_reward + data_int[6]-1
 				a2_reward = a2_reward + data_int[7]-1
 				done = data_int[8]
+				prof.mark("process")
 
 				# If end of game episode, process replay memeory with done at end (i.e., 1)
 				# Output current episdoe data to terminal window
 				if done:
 					a1_episode_reward = a1_episode_reward+a1_reward 					# update episode a1 reward
 					a2_episode_reward = a2_episode_reward+a2_reward 					# update episode a2 reward
-					agent1.remember(a1_oldstate, a1_action, a1_reward, a1_newstate, 1)	# add new dtata to a1 agent replay memory
-					agent2.remember(a2_oldstate, a2_action, a2_reward, a2_newstate, 1)	# add new dtata to a2 agent replay memory
-					agent1.replay(reply_size, fcount) 									# process action replay minibatch
-					agent2.replay(reply_size, fcount) 									# process action replay minibatch
+					agent1.remember(a1_oldstate, a1_action, a1_reward, a1_newstate, 1, source=1)	# add new dtata to a1 agent replay memory
+					agent2.remember(a2_oldstate, a2_action, a2_reward, a2_newstate, 1, source=2)	# add new dtata to a2 agent replay memory (a separate source, so n-step transitions are built per paddle in self-play)
+					prof.mark("remember")
+					agents.replay(reply_size, fcount) 									# process action replay minibatch (for both agents)
+					prof.mark("replay")
 
 					# Print and save current episode data
 					print("Episode: {}, Frame Count: {}, A1 Epsilon: {},  A2 Epsilon: {}, Total A1 Reward: {}, Total A2 Reward: {}".format(episode, fcount, agent1.epsilon, agent2.epsilon, a1_episode_reward, a2_episode_reward))
 					episodeDFile.write(str(episode) + "," + str(fcount) + "," + str(agent1.epsilon) + "," + str(agent2.epsilon) + "," + str(a1_episode_reward) + "," + str(a2_episode_reward) + "\n")
-
-					# Save current weights for agent' sNN model
-					a1fname = wfiledir + "/a1w_ep" + str(episode) + ".h5"				# set filename for current model weights for a1
-					agent1.save(a1fname)												# save cuurent model (NN) weights to file for a1
-					a2fname = wfiledir + "/a2w_ep" + str(episode) + ".h5"				# set filename for current model weights for a2
-					agent2.save(a2fname)												# save cuurent model (NN) weights to file for a2
+					prof.mark("log")
+
+					# Save current weights for agents' NN models (written to file by background threads)
+					a1ckpt.episode_end(episode, a1_episode_reward)
+					a2ckpt.episode_end(episode, a2_episode_reward)
+					agent1.flush_replay_memory()								# save replay memory positions (if kept in files)
+					agent2.flush_replay_memory()
+					if snapshot_dir is not None:
+						agent1.save_snapshot(snapshot_dir + "/a1snapshot.h5", fcount=fcount+1, episode=episode+1)	# save training states (to resume from next episode)
+						if not self_play:
+							agent2.save_snapshot(snapshot_dir + "/a2snapshot.h5", fcount=fcount+1, episode=episode+1)
+					prof.mark("checkpoint")
+
+					# Print and save profile stats (if profiling)
+					if episode % profile_every == 0:
+						prof.dump(episode)
 
 					episode = episode+1													# increase episode count
 					a1_episode_reward = 0												# rest total a1 reward for episode
@@ -188,20 +268,21 @@ while True:
 					a2_reward = 0														# rest current a2 reward
 					a1_action = 0														# set a1 action to 0
 					a2_action = 0														# set a12 action to 0
-					message = "1 0 0 "													# set new outgoing message, with game rest
+					message = wire.encode(1, 0, 0)													# set new outgoing message, with game rest
 				
 				else:
 					# Process every n-frames or if game is done (over)
 					if fcount % pframe == 0:
 						a1_episode_reward = a1_episode_reward+a1_reward 					# update episode a1 reward
 						a2_episode_reward = a2_episode_reward+a2_reward 					# update episode a2 reward
-						agent1.remember(a1_oldstate, a1_action, a1_reward, a1_newstate, 0)	# add new dtata to a1 agent replay memory
-						agent2.remember(a2_oldstate, a2_action, a2_reward, a2_newstate, 0)	# add new dtata to a2 agent replay memory
-						agent1.replay(reply_size, fcount) 									# process action replay minibatch
-						agent2.replay(reply_size, fcount) 									# process action replay minibatch
-						a1_action = agent1.act(a1_newstate)									# determine new action from new state data
-						a2_action = agent2.act(a2_newstate)									# determine new action from new state data
-						message = "0 {} {} ".format(a1_action, a2_action)					# set new outgoing message
+						agent1.remember(a1_oldstate, a1_action, a1_reward, a1_newstate, 0, source=1)	# add new dtata to a1 agent replay memory
+						agent2.remember(a2_oldstate, a2_action, a2_reward, a2_newstate, 0, source=2)	# add new dtata to a2 agent replay memory (a separate source, so n-step transitions are built per paddle in self-play)
+						prof.mark("remember")
+						agents.replay(reply_size, fcount) 									# process action replay minibatch (for both agents)
+						prof.mark("replay")
+						a1_action, a2_action = agents.act([a1_newstate, a2_newstate])		# determine new actions from new state data (one forward pass for both agents/paddles)
+						prof.mark("act")
+						message = wire.encode(0, a1_action, a2_action)					# set new outgoing message
 						a1_oldstate = a1_newstate 											# save new state data as old state data
 						a2_oldstate = a2_newstate 											# save new state data as old state data
 						a1_reward = 0														# rest current reward
@@ -209,14 +290,16 @@ while True:
 				
 				# send current rest and action message to unity game	
 				connection.sendall(message)
+				prof.mark("send")
 
 				# update target NN model after n-frames
 				if fcount % targ_update == 0:
-					agent1.update_target_model()								# update a1's target model (NN)
-					agent2.update_target_model()								# update a2's target model (NN)
+					agents.update_target_model()								# update a1's and a2's target models (NN)
+					prof.mark("target")
 
 				# update frame count
 				fcount = fcount+1
+				prof.frame()
 
 			else:
 				# break if no more data comming in from client
@@ -227,12 +310,22 @@ while True:
 		# Clean up the connection
 		connection.close()
 
-		#close edisode data file
+		#close edisode data file and finish writing weights files
 		episodeDFile.close()
-
-		# earse (delete, clear) replay memory array
-		agent1.erase_replay_memory()
-		agent2.erase_replay_memory()
+		a1ckpt.close()
+		a2ckpt.close()
+
+		# stop learner threads (if any) and agent worker threads, and earse (delete, clear) replay memory array (or save it, if kept in files)
+		if async_learning:
+			trainer1.stop()
+			trainer2.stop()
+		agents.stop()
+		if replay_dir is None:
+			agent1.erase_replay_memory()
+			agent2.erase_replay_memory()
+		else:
+			agent1.flush_replay_memory()
+			agent2.flush_replay_memory()
 
 		# Close TCP connnection and socket and break to exit
 		print("Client connection closed and reply memory earsed")
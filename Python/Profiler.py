@@ -0,0 +1,91 @@
+# *****************************************************************************
+#
+# Per-Phase Timing (Profiling) of Training Loops for DQN Agents Playing Unity Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# A PhaseTimer times each phase of a training loop (e.g., recv, parse, remember,
+# replay, act, send) as laps: mark(phase) adds the time since the previous mark
+# to that phase. For each phase, the number of laps, the total and max lap time
+# and a histogram of lap times (log spaced bins) are kept, along with the number
+# of frames processed (for frames per second). dump appends the stats since the
+# last dump to a csv file (e.g., every n episodes) and then resets them.
+#
+# When a PhaseTimer is not enabled, all methods return straight away, so it can
+# be left in a training loop at (almost) no cost.
+#
+# *****************************************************************************
+
+import math
+from timeit import default_timer as timer
+
+class PhaseTimer:
+    def __init__(self, fname=None, enabled=True, bins_per_decade=4, min_time=1e-6, max_time=10.):
+        self.fname = fname                          # csv file the stats are appended to by dump (None = no file)
+        self.enabled = enabled                      # time phases (otherwise all methods do nothing)
+        self.bins_per_decade = bins_per_decade      # number of histogram bins per factor of 10 in lap time
+        self.min_time = min_time                    # upper edge (in seconds) of first histogram bin
+        self.num_bins = int(round(math.log10(max_time / min_time) * bins_per_decade)) + 2     # (last bin is >= max_time)
+        self.edges = [min_time * 10 ** (i / float(bins_per_decade)) for i in range(self.num_bins - 1)]
+        self.phases = []                            # phase names (in the order first marked)
+        self.stats = {}                             # [count, total time, max time, histogram] for each phase
+        self.frames = 0                             # number of frames since last dump
+        self.last = timer()                         # time of last mark
+        self.start = self.last                      # time of last dump
+        if enabled and fname is not None:
+            f = open(fname, "w")
+            f.write("Episode, Phase, Count, TotalSec, MeanMs, MaxMs, Share, Frames, FPS, " + ", ".join("H<{:g}".format(e) for e in self.edges) + ", H>={:g}\n".format(self.edges[-1]))
+            f.close()
+
+    # Start timing a lap (e.g., discard time spent waiting before the training loop starts)
+    def lap(self):
+        if self.enabled:
+            self.last = timer()
+
+    # Add the time since the last mark to phase
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = timer()
+        dt = now - self.last
+        self.last = now
+        s = self.stats.get(phase)
+        if s is None:
+            s = self.stats[phase] = [0, 0., 0., [0] * self.num_bins]
+            self.phases.append(phase)
+        s[0] += 1
+        s[1] += dt
+        if dt > s[2]:
+            s[2] = dt
+        if dt < self.min_time:
+            s[3][0] += 1
+        else:
+            s[3][min(int(math.log10(dt / self.min_time) * self.bins_per_decade) + 1, self.num_bins - 1)] += 1
+
+    # Count a processed frame (for frames per second)
+    def frame(self):
+        if self.enabled:
+            self.frames += 1
+
+    # Frames per second since last dump
+    def fps(self):
+        elapsed = timer() - self.start
+        return self.frames / elapsed if elapsed > 0 else 0.
+
+    # Print a one line summary (frames per second and share of time in each phase) and append
+    # the stats since last dump to the csv file, then reset stats
+    def dump(self, episode):
+        if not self.enabled:
+            return
+        fps = self.fps()
+        total = sum(s[1] for s in self.stats.values()) or 1.
+        print("Profile: FPS: {:.1f}, ".format(fps) + ", ".join("{}: {:.1f}%".format(p, 100 * self.stats[p][1] / total) for p in self.phases))
+        if self.fname is not None:
+            f = open(self.fname, "a")
+            for p in self.phases:
+                count, phase_time, max_time, hist = self.stats[p]
+                f.write("{},{},{},{:.6f},{:.4f},{:.4f},{:.4f},{},{:.2f},".format(episode, p, count, phase_time, 1000 * phase_time / max(count, 1), 1000 * max_time, phase_time / total, self.frames, fps) + ",".join(str(h) for h in hist) + "\n")
+            f.close()
+        self.stats = {}
+        self.phases = []
+        self.frames = 0
+        self.start = self.last = timer()
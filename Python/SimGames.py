@@ -0,0 +1,364 @@
+# *****************************************************************************
+#
+# Simulated (pure Python/NumPy) versions of the Unity WallPong and Pong Games
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# The simulated games follow the rules of the Unity games (wpAIController.cs and
+# pongMultiAIGameController.cs) and send the same game frames (in the order and
+# encoding sent by the games' CollectGameData), i.e.:
+#   WallPong: ball_x, ball_x_velocity, ball_y, ball_y_velocity, paddle_y, reward, done
+#   Pong:     ball_x, ball_x_velocity, ball_y, ball_y_velocity, paddle1_y, paddle2_y, reward1, reward2, done
+# where positions are divided by the field size (ball x clamped to 0 to 1) and
+# velocities are encoded as (velocity + 30) / 32 (see UnityLink.encode_velocity).
+#
+# Game rules (as in the Unity games):
+#   - Messages are reset flag and action(s): 0=do nothing; 1=up; 2=down; 3=serve.
+#     The paddles move 1 unit per frame, between y = 4 and 27.
+#   - The ball waits at the serving paddle until action 3 is sent and is then
+#     served at speed 30 (WallPong: towards the wall, at a small random angle;
+#     Pong: straight towards the other paddle).
+#   - A paddle hit sends the ball back at speed 30, at an angle set by where the
+#     ball hits the paddle (Pong paddle 2 adds a small random angle).
+#   - WallPong: reward 2 for a hit, 0 for a miss (a lost life) and 1 otherwise.
+#     The game is over (done = 1) when all 3 lives are lost or after 25 hits.
+#   - Pong: a miss gives reward 0 to the paddle that missed and 2 to the other
+#     paddle (which scores a point and serves next); rewards are 1 otherwise
+#     (hits give no reward). The game is over when a paddle scores 5 points.
+#   - A reset flag of 1 starts a new game (lives and scores are reset); the
+#     ball and paddles are not moved.
+#
+# Differences from the Unity games (approximations):
+#   - Ball physics are stepped once per frame by a fixed frame_time (Unity steps
+#     its physics engine at its own rate, independent of the messages).
+#   - The ball is a point and the paddles are lines of height paddle_height
+#     (the ball and paddle sizes and the Pong paddle x positions are set in the
+#     Unity scenes and are approximated here).
+#   - Pong: the first serve side is random, as at the start of the Unity game
+#     (which makes it once, when the game starts).
+#
+# A simulated game can be used in place of the Unity game:
+#   SimConnection: in-process stand-in for the accepted game connection (no TCP,
+#                  no Unity), so training is not limited to the game's frame rate.
+#   SimClient:     connects to a training/testing script over TCP (like the Unity
+#                  game does), e.g., for testing the socket/wire protocol code.
+#
+# *****************************************************************************
+
+import socket
+import numpy as np
+from UnityLink import get_protocol, FrameReceiver, encode_velocity
+
+field_width = 38.           # field width: the ball is lost at x = 0 (Pong paddle 1) or x = field_width (WallPong, Pong paddle 2)
+field_height = 31.          # field height: the bottom wall is at y = 0 and the top wall at y = field_height
+ball_speed = 30.            # ball speed (units per second)
+frame_time = .02            # game time per frame (one frame per message; Unity's default physics time step)
+paddle_y_min = 4.           # lowest paddle y position
+paddle_y_max = 27.          # highest paddle y position
+paddle_start_y = 15.5       # paddle y position at the start
+paddle_height = 4.          # paddle height (approximate)
+paddle_offset = 2.          # x distance from the serving paddle to the ball before it is served
+serve_action = 3            # action that serves the ball
+wallpong_paddle_x = 37.     # x position of the WallPong paddle
+wallpong_lives = 3          # WallPong lives per game
+wallpong_win_score = 25     # WallPong hits to win a game
+pong_paddle_x = (1., 37.)   # x positions of Pong paddles 1 and 2 (approximate)
+pong_win_score = 5          # Pong points to win a game
+
+
+# Single agent WallPong game: agent moves a paddle (at x = 37) to hit a ball against a wall (at x = 0)
+class WallPongSim:
+    num_floats = 5          # number of float values per game frame
+    num_ints = 2            # number of integer values per game frame
+    num_actions = 1         # number of actions per message (one agent)
+
+    def __init__(self, seed=None):
+        self.rng = np.random.RandomState(seed)
+        self.paddle_y = paddle_start_y
+        self.lives = wallpong_lives
+        self.score = 0                          # number of hits in the current game
+        self.fired = False                      # ball served (not waiting at the paddle)
+        self.hold_ball()
+
+    # Put the ball in front of the paddle (not moving) until it is served
+    def hold_ball(self):
+        self.ball = np.array([wallpong_paddle_x - paddle_offset, self.paddle_y])
+        self.velocity = np.zeros(2)
+
+    # Advance the game one frame using the reset flag (1 = new game) and the agent action
+    # (0=do nothing; 1=up; 2=down; 3=serve)
+    def step(self, reset, action):
+        old_x = self.ball[0]
+        self.ball += self.velocity * frame_time
+        bounce_walls(self.ball, self.velocity)
+        if self.ball[0] <= 0:
+            self.ball[0] = -self.ball[0]
+            self.velocity[0] = abs(self.velocity[0])
+        hit = hit_paddle(self.ball, self.velocity, old_x, wallpong_paddle_x, self.paddle_y, -1)
+        if reset:
+            self.lives = wallpong_lives
+            self.score = 0
+        if not self.fired:
+            self.hold_ball()
+            if action == serve_action:
+                self.velocity = unit_vectors(-1, self.rng.uniform(-.2, .2)) * ball_speed
+                self.fired = True
+        self.paddle_y = move_paddle(self.paddle_y, action)
+        frame = self.frame()
+        reward = 1
+        if frame[0] == 1:                       # missed: lose a life
+            self.hold_ball()
+            self.fired = False
+            self.lives -= 1
+            reward = 0
+        if hit:
+            self.score += 1
+            reward = 2
+        done = 0
+        if self.lives <= 0:
+            done = 1
+        if self.score >= wallpong_win_score:    # won: the ball waits at the paddle
+            self.hold_ball()
+            self.fired = False
+            done = 1
+        return frame + [reward, done]
+
+    def frame(self):
+        return [ball_x(self.ball[0]), encode_velocity(self.velocity[0]), self.ball[1] / field_height,
+                encode_velocity(self.velocity[1]), self.paddle_y / field_height]
+
+
+# Two agent Pong game: paddle 1 is on the left (x = 1) and paddle 2 on the right (x = 37)
+# If only one action is sent (agent vs human), paddle 2 serves and follows the ball (a stand-in for the human player)
+class PongSim:
+    num_floats = 6          # number of float values per game frame
+    num_ints = 3            # number of integer values per game frame
+    num_actions = 2         # number of actions per message (two agents)
+
+    def __init__(self, seed=None):
+        self.rng = np.random.RandomState(seed)
+        self.paddle_y = np.array([paddle_start_y, paddle_start_y])
+        self.scores = [0, 0]
+        self.fired = False                      # ball served (not waiting at the serving paddle)
+        self.server = self.rng.randint(2)       # serving paddle (0 = paddle 1, 1 = paddle 2)
+        self.hold_ball()
+
+    # Put the ball in front of the serving paddle (not moving) until it is served
+    def hold_ball(self):
+        direction = 1 - 2 * self.server
+        self.ball = np.array([pong_paddle_x[self.server] + direction * paddle_offset, self.paddle_y[self.server]])
+        self.velocity = np.zeros(2)
+
+    # Advance the game one frame using the reset flag (1 = new game) and the paddle 1 and paddle 2
+    # actions (0=do nothing; 1=up; 2=down; 3=serve)
+    def step(self, reset, action1, action2=None):
+        if action2 is None:
+            action2 = self.stand_in_action()
+        old_x = self.ball[0]
+        self.ball += self.velocity * frame_time
+        bounce_walls(self.ball, self.velocity)
+        if not hit_paddle(self.ball, self.velocity, old_x, pong_paddle_x[0], self.paddle_y[0], 1):
+            hit_paddle(self.ball, self.velocity, old_x, pong_paddle_x[1], self.paddle_y[1], -1, self.rng.uniform(-.1, .1))
+        if reset:
+            self.scores = [0, 0]
+        if not self.fired:
+            self.hold_ball()
+            if (action1, action2)[self.server] == serve_action:
+                self.velocity = np.array([1 - 2 * self.server, 0.]) * ball_speed
+                self.fired = True
+        self.paddle_y[0] = move_paddle(self.paddle_y[0], action1)
+        self.paddle_y[1] = move_paddle(self.paddle_y[1], action2)
+        frame = self.frame()
+        rewards = [1, 1]
+        if frame[0] in (0, 1):                  # missed: the other paddle scores and serves next
+            winner = 1 - int(frame[0])
+            rewards[winner], rewards[1 - winner] = 2, 0
+            self.scores[winner] += 1
+            self.server = winner
+            self.hold_ball()
+            self.fired = False
+        done = 1 if max(self.scores) >= pong_win_score else 0
+        return frame + rewards + [done]
+
+    # Paddle 2 action of the stand-in human player: serve, then follow the ball
+    def stand_in_action(self):
+        if not self.fired and self.server == 1:
+            return serve_action
+        if self.ball[1] > self.paddle_y[1] + .5:
+            return 1
+        if self.ball[1] < self.paddle_y[1] - .5:
+            return 2
+        return 0
+
+    def frame(self):
+        return [ball_x(self.ball[0]), encode_velocity(self.velocity[0]), self.ball[1] / field_height,
+                encode_velocity(self.velocity[1]), self.paddle_y[0] / field_height, self.paddle_y[1] / field_height]
+
+
+# Batch of N WallPong games stepped in lockstep using (N, ...) numpy arrays (same rules as WallPongSim)
+# Game frames are returned as an (N, 7) array (one WallPong game frame per row, in the same order as WallPongSim)
+class WallPongVecSim:
+    num_floats = 5          # number of float values per game frame
+    num_ints = 2            # number of integer values per game frame
+
+    def __init__(self, num_games, seed=None):
+        self.num_games = num_games
+        self.rng = np.random.RandomState(seed)
+        self.paddle_y = np.full(num_games, paddle_start_y)
+        self.lives = np.full(num_games, wallpong_lives, dtype=int)
+        self.score = np.zeros(num_games, dtype=int)         # number of hits in each game
+        self.fired = np.zeros(num_games, dtype=bool)        # ball served (not waiting at the paddle)
+        self.ball = np.zeros((num_games, 2))
+        self.velocity = np.zeros((num_games, 2))
+        self.hold_ball(~self.fired)
+
+    # Put the ball of the given games (boolean array) in front of the paddle (not moving) until it is served
+    def hold_ball(self, games):
+        self.ball[games, 0] = wallpong_paddle_x - paddle_offset
+        self.ball[games, 1] = self.paddle_y[games]
+        self.velocity[games] = 0
+
+    # Advance all games one frame using an array of agent actions (0=do nothing; 1=up; 2=down; 3=serve) and
+    # an optional array of reset flags (1 = new game)
+    def step(self, actions, reset=None):
+        actions = np.asarray(actions)
+        old_x = self.ball[:, 0].copy()
+        self.ball += self.velocity * frame_time
+        # bounce off top and bottom walls
+        low, high = self.ball[:, 1] <= 0, self.ball[:, 1] >= field_height
+        self.ball[low, 1] = -self.ball[low, 1]
+        self.ball[high, 1] = 2 * field_height - self.ball[high, 1]
+        self.velocity[low, 1] = abs(self.velocity[low, 1])
+        self.velocity[high, 1] = -abs(self.velocity[high, 1])
+        # bounce off left wall
+        wall = self.ball[:, 0] <= 0
+        self.ball[wall, 0] = -self.ball[wall, 0]
+        self.velocity[wall, 0] = abs(self.velocity[wall, 0])
+        # hit ball at paddle
+        hit = (old_x < wallpong_paddle_x) & (self.ball[:, 0] >= wallpong_paddle_x) & (abs(self.ball[:, 1] - self.paddle_y) <= paddle_height / 2)
+        self.ball[hit, 0] = 2 * wallpong_paddle_x - self.ball[hit, 0]
+        self.velocity[hit] = unit_vectors(-1, (self.ball[hit, 1] - self.paddle_y[hit]) / paddle_height) * ball_speed
+        # process messages (reset, serve and move paddle)
+        if reset is not None:
+            reset = np.asarray(reset, dtype=bool)
+            self.lives[reset] = wallpong_lives
+            self.score[reset] = 0
+        self.hold_ball(~self.fired)
+        serve = ~self.fired & (actions == serve_action)
+        self.velocity[serve] = unit_vectors(-1, self.rng.uniform(-.2, .2, serve.sum())) * ball_speed
+        self.fired |= serve
+        self.paddle_y += ((actions == 1) & (self.paddle_y < paddle_y_max)).astype(float) - ((actions == 2) & (self.paddle_y > paddle_y_min))
+        frame = self.frame()
+        # miss (lose a life), hit and game over (all lives lost or won)
+        miss = frame[:, 0] == 1
+        self.hold_ball(miss)
+        self.fired[miss] = False
+        self.lives[miss] -= 1
+        self.score[hit] += 1
+        reward = np.where(hit, 2, np.where(miss, 0, 1))
+        won = self.score >= wallpong_win_score
+        self.hold_ball(won)
+        self.fired[won] = False
+        done = (self.lives <= 0) | won
+        return np.column_stack([frame, reward, done])
+
+    def frame(self):
+        return np.column_stack([np.clip(self.ball[:, 0] / field_width, 0, 1), encode_velocity(self.velocity[:, 0]), self.ball[:, 1] / field_height,
+                                encode_velocity(self.velocity[:, 1]), self.paddle_y / field_height])
+
+
+# Normalized ball x position, as sent in a game frame (0 to 1; 0 or 1 = ball lost)
+def ball_x(x):
+    return min(max(x / field_width, 0.), 1.)
+
+# Unit vector(s) in direction (x, y) (one row per value, if x or y is an array)
+def unit_vectors(x, y):
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    length = np.sqrt(x ** 2 + y ** 2)
+    return np.stack([x / length, y / length], axis=-1)
+
+# Move a paddle up (action 1) or down (action 2) by 1 unit, unless it is at its highest or lowest position
+def move_paddle(paddle_y, action):
+    if action == 1 and paddle_y < paddle_y_max:
+        paddle_y += 1
+    elif action == 2 and paddle_y > paddle_y_min:
+        paddle_y -= 1
+    return paddle_y
+
+# Bounce the ball off the top and bottom walls (in place)
+def bounce_walls(ball, velocity):
+    if ball[1] <= 0:
+        ball[1] = -ball[1]
+        velocity[1] = abs(velocity[1])
+    elif ball[1] >= field_height:
+        ball[1] = 2 * field_height - ball[1]
+        velocity[1] = -abs(velocity[1])
+
+# Bounce the ball off a paddle (in place) if it crossed the paddle's x position (from old_x) within the paddle's height
+# The ball leaves the paddle in direction (1 = right, -1 = left) at ball speed, at an angle set by the hit factor (the
+# ball's y distance from the paddle center over the paddle height) plus spin; returns True if the paddle hit the ball
+def hit_paddle(ball, velocity, old_x, paddle_x, paddle_y, direction, spin=0.):
+    if not (old_x - paddle_x) * direction > 0 >= (ball[0] - paddle_x) * direction:
+        return False
+    if abs(ball[1] - paddle_y) > paddle_height / 2:
+        return False
+    ball[0] = 2 * paddle_x - ball[0]
+    velocity[:] = unit_vectors(direction, (ball[1] - paddle_y) / paddle_height + spin) * ball_speed
+    return True
+
+
+# Apply a (reset, action(s)) message to a simulated game and return the resulting game frame
+def play_message(game, message):
+    return game.step(*[int(v) for v in message])
+
+
+# In-process stand-in for the game connection returned by sock.accept()
+# Each message sent (reset, action(s)) advances the simulated game by one frame, which is then
+# available to recv (encoded using the same wire protocol as the Unity game)
+# num_actions is the number of actions per message (defaults to the game's number of agents)
+class SimConnection:
+    def __init__(self, game, wire, num_actions=None):
+        num_actions = num_actions or game.num_actions
+        self.game = game                # simulated game (WallPongSim or PongSim)
+        self.wire = wire                # wire protocol used by the script
+        self.messages = get_protocol(wire.name, 0, 1 + num_actions, 0)   # protocol for messages sent to the game
+        self.sent = b""                 # sent bytes not yet forming a complete message
+        self.frames = b""               # encoded game frames not yet received
+
+    def sendall(self, data):
+        messages, self.sent = self.messages.split_frames(self.sent + data)
+        for message in messages:
+            self.frames += self.wire.encode_frame(play_message(self.game, message))
+
+    def recv(self, bufsize):
+        data, self.frames = self.frames[:bufsize], self.frames[bufsize:]
+        return data
+
+    def close(self):
+        self.frames = b""
+
+
+# TCP client that plays a simulated game with a training/testing script (in place of the Unity game)
+class SimClient:
+    def __init__(self, game, wire, server_address=('localhost', 10000), num_actions=None):
+        self.game = game                        # simulated game (WallPongSim or PongSim)
+        self.wire = wire                        # wire protocol used by the script
+        self.num_actions = num_actions or game.num_actions  # number of actions per message
+        self.server_address = server_address    # address of training/testing script
+        self.frame_count = 0                    # number of game frames sent
+
+    # Connect to the script and play until the script closes the connection (or max_frames are sent)
+    def run(self, max_frames=None):
+        sock = socket.create_connection(self.server_address)
+        receiver = FrameReceiver(sock, get_protocol(self.wire.name, 0, 1 + self.num_actions, 0))
+        try:
+            while max_frames is None or self.frame_count < max_frames:
+                message = receiver.recv_frame()
+                if message is None:
+                    break
+                sock.sendall(self.wire.encode_frame(play_message(self.game, message)))
+                self.frame_count += 1
+        except socket.error:
+            pass    # connection reset when the script closes it
+        finally:
+            sock.close()
+
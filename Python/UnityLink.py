@@ -0,0 +1,242 @@
+# *****************************************************************************
+#
+# Wire Protocols for the Python <-> Unity Game (TCP socket) Connection
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# Game -> Python messages (one per game frame) contain n float values (game
+# state) followed by m integer values (rewards and done). Python -> Game
+# messages contain an integer reset flag followed by one integer action per agent.
+#
+# TCP is a byte stream, so a single recv can return part of a game frame or several
+# game frames. FrameReceiver buffers the incoming bytes and returns complete frames.
+# MultiClientServer accepts many game connections and returns their frames as they arrive.
+#
+# Two protocols are available:
+#   text:   space-separated ASCII values (the original protocol), e.g. "0 2 ". Game
+#           frames are sent as the Unity games send them: floats with exactly 3
+#           decimals ("F3"), then single digit integers, with no trailing space,
+#           e.g. "0.500 0.938 0.500 0.938 0.500 1 0".
+#   binary: fixed-size little-endian records packed as float32 (state) and
+#           int32 (rewards, done, reset, actions) values. No string formatting
+#           or parsing is required and the record size never changes.
+#
+# *****************************************************************************
+
+import re
+import select
+import struct
+from collections import deque
+
+# Game frame velocity encoding (as in the Unity games' CollectGameData): velocities are sent as
+# (velocity + velocity_offset) / velocity_scale, so a 0 velocity is sent as 0.9375
+velocity_offset = 30.       # velocity offset (the games' ball speed)
+velocity_scale = 32.        # velocity scale
+
+# Encode a velocity (or an array of velocities) as sent in a game frame
+def encode_velocity(velocity):
+    return (velocity + velocity_offset) / velocity_scale
+
+# Return the encoded velocity of the opposite (negated) velocity, e.g., to mirror a game frame left to right
+def mirror_velocity(encoded):
+    return 2 * velocity_offset / velocity_scale - encoded
+
+# Original space-separated ASCII protocol
+class TextProtocol:
+    name = "text"
+    float_value = re.compile(br"\s*(-?\d+\.\d{3})")  # game frame float value (Unity "F3" format)
+    int_value = re.compile(br"\s*(-?\d)")              # game frame integer value (single digit)
+    partial_value = re.compile(br"\s*-?\d*\.?\d*\Z")  # start of a value (not received yet in full)
+
+    def __init__(self, num_floats, num_ints):
+        self.num_floats = num_floats        # number of float values per game frame
+        self.num_ints = num_ints            # number of integer values per game frame
+
+    # Convert a game frame into a list of float values
+    def decode(self, data):
+        return [float(v) for v in data.split()]
+
+    # Split buffered bytes into complete (decoded) game frames and the remaining (partial frame) bytes
+    # The Unity games send no separator after the last value of a frame, so two frames can arrive joined
+    # (e.g. "... 1 00.500 ..."). Values are therefore read by their fixed format, in frame order: each float
+    # has exactly 3 decimals and each integer is a single digit, so a value ends where its format ends,
+    # whether or not whitespace follows it
+    def split_frames(self, buffer):
+        slots = [self.float_value] * self.num_floats + [self.int_value] * self.num_ints
+        frames = []
+        start = 0       # start of the first frame not yet complete
+        while True:
+            frame = []
+            pos = start
+            for value in slots:
+                match = value.match(buffer, pos)
+                if match is None:
+                    break
+                frame.append(float(match.group(1)))
+                pos = match.end()
+            if len(frame) < len(slots):
+                break
+            frames.append(frame)
+            start = pos
+        if not self.partial_value.match(buffer, pos):
+            raise ValueError("Bad game frame data: {!r}".format(buffer[start:]))
+        return frames, buffer[start:]
+
+    # Convert a reset flag and agent action(s) into an outgoing message
+    def encode(self, reset, *actions):
+        return " ".join(str(v) for v in (reset,) + actions).encode("ascii") + b" "
+
+    # Convert game frame values into a message (game side, used by simulated games)
+    def encode_frame(self, values):
+        floats = ["{:.3f}".format(v) for v in values[:self.num_floats]]
+        ints = [str(int(v)) for v in values[self.num_floats:]]
+        return " ".join(floats + ints).encode("ascii")
+
+
+# Fixed-size packed binary protocol
+class BinaryProtocol:
+    name = "binary"
+
+    def __init__(self, num_floats, num_ints, num_actions):
+        self.num_floats = num_floats        # number of float32 values per game frame
+        self.num_ints = num_ints            # number of int32 values per game frame
+        self.frame_format = struct.Struct("<{}f{}i".format(num_floats, num_ints))   # incoming game frame record
+        self.message_format = struct.Struct("<{}i".format(1 + num_actions))         # outgoing reset + action(s) record
+        self.frame_size = self.frame_format.size    # number of bytes per game frame
+
+    # Convert a game frame into a tuple of values (floats then integers)
+    def decode(self, data):
+        return self.frame_format.unpack(data)
+
+    # Split buffered bytes into complete (decoded) game frames and the remaining (partial frame) bytes
+    def split_frames(self, buffer):
+        size = self.frame_size
+        used = (len(buffer) // size) * size
+        frames = [self.frame_format.unpack_from(buffer, i) for i in range(0, used, size)]
+        return frames, buffer[used:]
+
+    # Convert a reset flag and agent action(s) into an outgoing message
+    def encode(self, reset, *actions):
+        return self.message_format.pack(reset, *actions)
+
+    # Convert game frame values into a message (game side, used by simulated games)
+    def encode_frame(self, values):
+        return self.frame_format.pack(*(list(values[:self.num_floats]) + [int(v) for v in values[self.num_floats:]]))
+
+
+# Return the protocol to use ("text" or "binary") for a game
+# num_floats/num_ints describe the incoming game frame and num_actions the outgoing message
+def get_protocol(name, num_floats, num_ints, num_actions):
+    if name == "text":
+        return TextProtocol(num_floats, num_ints)
+    if name == "binary":
+        return BinaryProtocol(num_floats, num_ints, num_actions)
+    raise ValueError("Unknown protocol: {} (use 'text' or 'binary')".format(name))
+
+
+# Buffered game frame receiver for a connection
+# Each recv reads all bytes queued on the socket (up to bufsize), so several game frames can be
+# received with one system call. Frames are then returned one at a time, either all in the order
+# received (policy="all") or, if more than one frame is waiting, only the most recent frame
+# (policy="latest"; stale frames are dropped, except frames with a reward or done flag, which are
+# always kept in order, so no reward or episode end is lost)
+class FrameReceiver:
+    def __init__(self, connection, wire, policy="all", bufsize=4096, timer=None):
+        if policy not in ("all", "latest"):
+            raise ValueError("Unknown frame policy: {} (use 'all' or 'latest')".format(policy))
+        self.connection = connection        # connected game socket
+        self.wire = wire                    # wire protocol (TextProtocol or BinaryProtocol)
+        self.policy = policy                # how queued frames are processed ("all" or "latest")
+        self.bufsize = bufsize              # max number of bytes read per recv
+        self.buffer = b""                   # received bytes not yet forming a complete frame
+        self.frames = deque()               # complete frames not yet processed
+        self.dropped = 0                    # number of stale frames dropped (policy="latest"; frames with a reward or done are never dropped)
+        self.timer = timer                  # PhaseTimer marking "recv" and "parse" phases (None = not timed)
+
+    # Read the bytes queued on the socket (one recv) and queue any complete frames
+    # Returns False if the game closed the connection
+    def receive(self):
+        data = self.connection.recv(self.bufsize)
+        if self.timer is not None:
+            self.timer.mark("recv")
+        if not data:
+            return False
+        frames, self.buffer = self.wire.split_frames(self.buffer + data)
+        if self.timer is not None:
+            self.timer.mark("parse")
+        if self.policy == "latest" and frames:
+            queued = list(self.frames) + frames
+            kept = [frame for frame in queued[:-1] if self.has_event(frame)] + queued[-1:]
+            self.dropped += len(queued) - len(kept)
+            self.frames.clear()
+            frames = kept
+        self.frames.extend(frames)
+        return True
+
+    # Whether a game frame has a reward (integer values before done, 1 = 0 reward) or done flag (last integer value)
+    def has_event(self, frame):
+        ints = frame[self.wire.num_floats:]
+        return ints[-1] != 0 or any(v != 1 for v in ints[:-1])
+
+    # Return the next complete game frame as a list of values, or None if the game closed the connection
+    def recv_frame(self):
+        while not self.frames:
+            if not self.receive():
+                return None
+        return self.frames.popleft()
+
+
+# Server for many game connections (e.g., several Unity game instances) on one listening socket
+# Connections are multiplexed using select, so no connection blocks the others. Each call to poll
+# returns at most one frame per connection (further frames stay queued, in order, for later polls)
+class MultiClientServer:
+    def __init__(self, sock, wire, initial_message, policy="all"):
+        self.sock = sock                        # bound and listening TCP socket
+        self.wire = wire                        # wire protocol (TextProtocol or BinaryProtocol)
+        self.initial_message = initial_message  # message sent to each game when it connects (e.g., reset)
+        self.policy = policy                    # how queued frames are processed ("all" or "latest")
+        self.receivers = {}                     # frame receiver for each connected game (by client address)
+        self.addresses = {}                     # client address of each connection
+
+    # Accept new connections and read from connections with data waiting (blocking up to timeout seconds,
+    # or until data arrives if timeout is None). Returns a list of (client_address, frame) pairs,
+    # where frame is None if the game closed the connection
+    def poll(self, timeout=None):
+        queued = [r for r in self.receivers.values() if r.frames]
+        readable = select.select([self.sock] + list(self.addresses), [], [], 0 if queued else timeout)[0]
+        ready = []
+        for connection in readable:
+            if connection is self.sock:
+                self.accept()
+                continue
+            client_address = self.addresses[connection]
+            if not self.receivers[client_address].receive():
+                ready.append((client_address, None))
+                self.disconnect(client_address)
+        for client_address, receiver in self.receivers.items():
+            if receiver.frames:
+                ready.append((client_address, receiver.frames.popleft()))
+        return ready
+
+    def accept(self):
+        connection, client_address = self.sock.accept()
+        print('connection from', client_address)
+        self.receivers[client_address] = FrameReceiver(connection, self.wire, self.policy)
+        self.addresses[connection] = client_address
+        connection.sendall(self.initial_message)
+
+    # Send a (reset, action(s)) message to a connected game
+    def send(self, client_address, message):
+        self.receivers[client_address].connection.sendall(message)
+
+    def disconnect(self, client_address):
+        print("Data stream from client {} stopped".format(client_address))
+        connection = self.receivers.pop(client_address).connection
+        del self.addresses[connection]
+        connection.close()
+
+    # Close all game connections
+    def close(self):
+        for connection in list(self.addresses):
+            connection.close()
+        self.receivers.clear()
+        self.addresses.clear()
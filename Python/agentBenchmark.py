@@ -0,0 +1,153 @@
+# *****************************************************************************
+# Benchmark Script for DQN Agent and Replay Memory Hot Paths
+#
+# Times DDQN_Agent act latency, replay throughput (for different minibatch
+# sizes and replay memory fill levels), remember cost, weights save/load time
+# and game message parse/encode cost, using synthetic (random) game states for
+# the 5 state WallPong and 6 state Pong configurations. No Unity game (or TCP
+# connection) is required.
+# Results are saved as csv (one row per benchmark), so runs on different
+# versions of the code can be compared to catch performance regressions.
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# 1. In Terminal, activate virtual env, with Python 2.7, tensorflow and keras installed
+# 2. run this script
+#
+# *****************************************************************************
+
+# **************************************************************************
+# Import Python Packages and Libraries
+import os
+import sys
+import time
+import random
+import tempfile
+import numpy as np
+from timeit import default_timer as timer
+
+# **************************************************************************
+# Import DDQN_Agent from Agent and wire protocols from UnityLink
+from Agent import DDQN_Agent as unityAgent
+from UnityLink import get_protocol
+
+# **************************************************************************
+# Initialize benchmark parameters
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+seed = 0			# random seed (synthetic states, transitions and network weights)
+action_size = 4		# set number of actions possible
+memory_length = 200000	# size of replay memory (as used by the training scripts)
+batch_sizes = [32, 64, 128, 256]	# replay minibatch sizes
+fill_levels = [.01, .1, .5, 1.]		# replay memory fill levels (fraction of memory_length)
+act_repeats = 2000		# number of timed calls for act benchmarks
+replay_repeats = 50		# number of timed calls for each replay benchmark
+remember_repeats = 5000	# number of timed calls for remember benchmarks
+saveload_repeats = 20	# number of timed calls for weights save/load benchmarks
+parse_repeats = 5000	# number of timed calls for message parse/encode benchmarks
+warmup = 5			# number of untimed calls before each benchmark
+
+# Game configurations: (name, state size, number of integer values per game frame, number of actions per message)
+configs = [("wallPong", 5, 2, 1), ("pong", 6, 3, 2)]
+
+# **************************************************************************
+# Initialize benchmark directory (folder) and data file
+timestr = time.strftime("%Y%m%d_%H%M%S")
+bfiledir = "./benchData_" + timestr
+if not os.path.exists(bfiledir):
+    os.makedirs(bfiledir)
+
+benchDfname = bfiledir + "/benchmarkData_" + timestr + ".csv"
+benchDFile = open(benchDfname, "w")
+benchDFile.write("Benchmark, Config, Backend, Variant, BatchSize, Fill, Repeats, MeanUs, MedianUs, P95Us, MinUs, PerSec\n")
+
+# **************************************************************************
+# Save benchmark parameters (and versions, so results from different machines/installs can be told apart)
+bPfname = bfiledir + "/benchmarkParameters" + timestr + ".txt"
+bPfile = open(bPfname, "w")
+bPfile.write("Python version: " + sys.version.split()[0] + "\n")
+bPfile.write("Numpy version: " + np.__version__ + "\n")
+bPfile.write("Backend: " + backend + "\n")
+bPfile.write("Seed: " + str(seed) + "\n")
+bPfile.write("Memory length: " + str(memory_length) + "\n")
+bPfile.write("Batch sizes: " + str(batch_sizes) + "\n")
+bPfile.write("Fill levels: " + str(fill_levels) + "\n")
+bPfile.close()
+
+# **************************************************************************
+# Time repeated calls of fn (after warmup calls); returns per-call times in seconds
+def time_calls(fn, repeats):
+	for i in range(warmup):
+		fn()
+	times = np.zeros(repeats)
+	for i in range(repeats):
+		start = timer()
+		fn()
+		times[i] = timer() - start
+	return times
+
+# Print and save one benchmark result (variant is the replay memory type or wire protocol)
+# per_call is the number of items (e.g., transitions or frames) processed per call, for PerSec
+def record(benchmark, config, times, variant="", batch_size="", fill="", per_call=1):
+	mean = times.mean()
+	row = [benchmark, config, backend, variant, batch_size, fill, len(times), 1e6 * mean, 1e6 * np.median(times),
+		   1e6 * np.percentile(times, 95), 1e6 * times.min(), per_call / mean]
+	print("{:<10} {:<9} {:<12} batch: {:<4} fill: {:<5} mean: {:10.1f} us, median: {:10.1f} us, per sec: {:12.1f}".format(
+		benchmark, config, variant, batch_size, fill, row[7], row[8], row[11]))
+	benchDFile.write(",".join(str(v) if not isinstance(v, float) else "{:.3f}".format(v) for v in row) + "\n")
+
+# Random transitions (states on the normalized range used by the games)
+def random_transitions(n, state_size):
+	return (np.random.rand(n, state_size), np.random.randint(action_size, size=n), np.random.randint(-1, 2, size=n),
+			np.random.rand(n, state_size), np.random.rand(n) < .01)
+
+# **************************************************************************
+# Run benchmarks for each game configuration
+np.random.seed(seed)
+random.seed(seed)
+try:
+	for config, state_size, num_ints, num_actions in configs:
+
+		# Act latency (greedy, i.e. epsilon = 0, so every call does a forward pass)
+		# unityAgent=(state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length, prioritized, backend)
+		agent = unityAgent(state_size, action_size, .99, .001, 0, .9999, 0, 0, 1, False, backend=backend)
+		state = np.random.rand(1, state_size)
+		record("act", config, time_calls(lambda: agent.act(state), act_repeats), batch_size=1)
+		states = np.random.rand(16, state_size)
+		record("act", config, time_calls(lambda: agent.act_batch(states), act_repeats), batch_size=16, per_call=16)
+
+		# Weights save and load time
+		wfname = os.path.join(tempfile.mkdtemp(), "bench.h5")
+		record("save", config, time_calls(lambda: agent.save(wfname), saveload_repeats))
+		record("load", config, time_calls(lambda: agent.load(wfname), saveload_repeats))
+		os.remove(wfname)
+		os.rmdir(os.path.dirname(wfname))
+
+		for prioritized in [False, True]:
+			memory = "prioritized" if prioritized else "uniform"
+			agent = unityAgent(state_size, action_size, .99, .001, 0, .9999, 0, 0, memory_length, prioritized, backend=backend)
+
+			# Remember cost (memory half full)
+			agent.memory.extend(*random_transitions(memory_length // 2, state_size))
+			transitions = iter(zip(*random_transitions(remember_repeats + warmup, state_size)))
+			record("remember", config, time_calls(lambda: agent.remember(*next(transitions)), remember_repeats), memory)
+
+			# Replay throughput (transitions trained per second) for each memory fill level and minibatch size
+			for fill in fill_levels:
+				agent.erase_replay_memory()
+				agent.memory.extend(*random_transitions(max(int(fill * memory_length), max(batch_sizes)), state_size))
+				for batch_size in batch_sizes:
+					record("replay", config, time_calls(lambda: agent.replay(batch_size, 0), replay_repeats), memory, batch_size, fill, batch_size)
+			agent.erase_replay_memory()
+
+		# Game message parse cost (split and decode one game frame) and outgoing message encode cost
+		for protocol in ["text", "binary"]:
+			wire = get_protocol(protocol, state_size, num_ints, num_actions)
+			message = wire.encode_frame(list(np.random.rand(state_size)) + [1] * num_ints)
+			record("parse", config, time_calls(lambda: wire.split_frames(message), parse_repeats), protocol)
+			messages = message * 16
+			record("parse", config, time_calls(lambda: wire.split_frames(messages), parse_repeats), protocol, 16, per_call=16)
+			actions = [0] * num_actions
+			record("encode", config, time_calls(lambda: wire.encode(0, *actions), parse_repeats), protocol)
+
+finally:
+	benchDFile.close()
+	print("Benchmark results saved to " + benchDfname + "\n\n")
@@ -0,0 +1,41 @@
+# *****************************************************************************
+#
+# Tests for the text wire protocol (UnityLink.py)
+# Run from the Python folder: python -m unittest test_UnityLink
+#
+# *****************************************************************************
+
+import unittest
+
+from UnityLink import TextProtocol
+
+class TextProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wire = TextProtocol(5, 2)      # wallPong game frames (5 floats, reward, done)
+
+    # Two Unity frames joined with no separator (Unity sends no space after the last value of a frame)
+    def test_split_joined_frames(self):
+        frames, remainder = self.wire.split_frames(b"1.000 0.938 0.500 0.938 0.500 0 00.974 0.938 0.484 0.938 0.500 2 1")
+        self.assertEqual(frames, [[1.0, 0.938, 0.5, 0.938, 0.5, 0, 0], [0.974, 0.938, 0.484, 0.938, 0.5, 2, 1]])
+        self.assertEqual(remainder, b"")
+
+    # A frame split across reads is returned once complete
+    def test_split_partial_frame(self):
+        data = b"0.500 0.938 0.500 0.938 0.500 1 00.974 0.9"
+        frames, remainder = self.wire.split_frames(data)
+        self.assertEqual(frames, [[0.5, 0.938, 0.5, 0.938, 0.5, 1, 0]])
+        self.assertEqual(remainder, b"0.974 0.9")
+        frames, remainder = self.wire.split_frames(remainder + b"38 0.484 0.938 0.500 1 0")
+        self.assertEqual(frames, [[0.974, 0.938, 0.484, 0.938, 0.5, 1, 0]])
+        self.assertEqual(remainder, b"")
+
+    def test_split_bad_data(self):
+        self.assertRaises(ValueError, self.wire.split_frames, b"0.500 x")
+
+    # Game frames are encoded as Unity encodes them: "F3" floats, single spaces, no trailing space
+    def test_encode_frame(self):
+        self.assertEqual(self.wire.encode_frame([1, .9375, .5, .9375, .5, 1, 0]), b"1.000 0.938 0.500 0.938 0.500 1 0")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+# *****************************************************************************
+# Example Unity Connection and DQN Training Script using Many Wall Pong Games
+#
+# Use with 2D Wall Pong Game
+# A single agent is trained using many game instances (e.g., 8 to 16 Unity
+# games) connected at the same time. Actions for all games with a new game
+# frame are chosen with one forward pass, and all game transitions are added
+# to the agent's (shared) replay memory. Replay (training and epsilon decay) is
+# processed once per transition, as in wallPong_aTrain.py.
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# 1. In Terminal, activate virtual env, with Python 2.7, tensorflow and keras installed
+# 2. run this script
+# 3. start unity games and click 'connect' in each (either in unity or as stand-alone apps)
+# 4. Watch... and watch... and watch... eventually AI success
+#
+# *****************************************************************************
+
+# **************************************************************************
+# Import Python Packages and Libraries
+import socket
+import os
+import time
+import threading
+import numpy as np
+
+# **************************************************************************
+# Import DDQN_Agent from Agent
+from Agent import DDQN_Agent as unityAgent
+from Learner import Learner
+from Checkpoint import CheckpointManager
+from UnityLink import get_protocol, MultiClientServer
+from SimGames import SimClient, WallPongSim
+
+# **************************************************************************
+# Initialize DDQL training and (s, a) state parameters
+num_episods = 2000	# number of episodes used for training (total over all games)
+state_size = 5		# set environment state size (wallPong: ball x, ball y, ball x velocity, ball y velocity, paddle y)
+action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up; 2=down)
+reply_size = 32 	# size of action replay minibatch
+targ_update = 1000	# specifies when the target model is updated, i.e., every n frames (counted over all games)
+pframe = 4			# specifies frame downsample factor (i.e., process action only every n frames)
+prioritized = False	# use prioritized experience replay (sample transitions proportional to TD error)
+async_learning = False	# train in a background learner thread (the game loop only acts and remembers)
+train_every = 1		# train the agent's NN every n replay calls (i.e., every n decision steps; 1 = every decision step)
+gradient_steps = 1	# number of minibatches (gradient steps) trained per training step (sampled in one go and trained with one fit call)
+n_step = 1			# number of rewards per remembered transition (n-step returns, bootstrapped from the state n decision steps later; 1 = 1-step)
+tau = None			# soft (Polyak) target model update rate per training step, e.g., .005 (None = copy weights to the target model every targ_update frames)
+replay_storage = "float32"	# replay memory state storage ("float32", or compact "float16" or "int16" = scaled 16 bit integers, which also store actions as bytes and done flags as bits: about half the memory per transition)
+ckpt_every = 1		# save agent's NN weights every n episodes (0 = never)
+ckpt_keep = 10		# number of most recent episode weights files kept (0 = keep all)
+ckpt_best = True	# also save NN weights for the best episode reward (as *_best.h5)
+protocol = "text"	# Unity wire protocol ("text" = space-separated ASCII, "binary" = fixed-size packed float32/int32 records)
+max_games = 16		# max number of game connections waiting to be accepted
+sim_games = 0		# number of simulated games (run in background threads) connected in addition to any Unity games
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+replay_dir = None	# directory for memory-mapped replay memory files, kept after training so training can be resumed with the same memory (None = memory in RAM, erased after training)
+snapshot_dir = None	# directory for training state snapshots (weights, target model, optimizer, epsilon, frame and episode counts), saved every episode; training resumes from them if they exist (None = no snapshots)
+
+# **************************************************************************
+# Initialize wire protocol for game messages (5 floats and 2 integers in, reset and 1 action(s) out)
+wire = get_protocol(protocol, 5, 2, 1)
+
+# **************************************************************************
+# Create a TCP/IP socket (bound before the agent is built, so a game can connect straight away) and a server for many game connections
+sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
+server_address = ('localhost', 10000)					 # Set TCP server address
+sock.bind(server_address)								 # Bind the TCP socket address to the port
+print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
+sock.listen(max_games)									 # Listen for incoming connections
+server = MultiClientServer(sock, wire, wire.encode(1, 0))	# each game is sent a reset message when it connects
+
+# **************************************************************************
+# Initiate agent
+# unityAgent=(state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length, prioritized, backend)
+agent = unityAgent(state_size, action_size, .99, .001, 1.0, .9999, .05, 25000, 200000, prioritized, backend=backend, background_build=True, memory_path=replay_dir, train_every=train_every, gradient_steps=gradient_steps, n_step=n_step, tau=tau, replay_storage=replay_storage)
+if snapshot_dir is not None and not os.path.exists(snapshot_dir):
+	os.makedirs(snapshot_dir)
+fcount_start, episode_start = 1, 1						# frame and episode counts training starts from
+if snapshot_dir is not None and os.path.exists(snapshot_dir + "/snapshot.h5"):
+	counters = agent.load_snapshot(snapshot_dir + "/snapshot.h5")		# resume training from last training state snapshot
+	fcount_start, episode_start = counters["fcount"], counters["episode"]
+	print("Resuming training from episode {} (frame {})".format(episode_start, fcount_start))
+trainer = Learner(agent, reply_size, targ_update // pframe) if async_learning else agent	# trains agent (replay and target model updates)
+if async_learning:
+	trainer.start()
+
+# **************************************************************************
+# Initialize weights directory (folder) and pre-filename string for saving agent's NN weights files
+timestr = time.strftime("%Y%m%d_%H%M%S")
+wfiledir = "./aWMultiData_" + timestr
+if not os.path.exists(wfiledir):
+    os.makedirs(wfiledir)
+
+# **************************************************************************
+# Initialize checkpoint manager(s) (NN weights files are written by a background thread)
+ckpt = CheckpointManager(agent, wfiledir + "/aw", ckpt_every, ckpt_keep, ckpt_best)
+
+# **************************************************************************
+# Initialize episode/training data file (for post-training analysis)
+episodeDfname = wfiledir + "/episodeData_" + timestr + ".csv"
+episodeDFile = open(episodeDfname, "w")
+episodeDFile.write("Episode, Game, Frame, Epsilon, EpisodeReward\n")
+
+# **************************************************************************
+# Save agent parameters
+aDfname = wfiledir + "/agentParameters" + timestr + ".txt"
+agent.save_agent_parameters(aDfname)
+
+# **************************************************************************
+# Save training parameters
+tDfname = wfiledir + "/trainingParameters" + timestr + ".txt"
+tDfile = open(tDfname, "w")
+tDfile.write("Number of episodes: " + str(num_episods) + "\n")
+tDfile.write("State size: " + str(state_size) + "\n")
+tDfile.write("Action size: " + str(action_size) + "\n")
+tDfile.write("Reply size: " + str(reply_size) + "\n")
+tDfile.write("Frame downsample factor: " + str(pframe) + "\n")
+tDfile.write("Wire protocol: " + protocol + "\n")
+tDfile.close()
+
+# Start simulated games (if any)
+for i in range(sim_games):
+	sim = threading.Thread(target=SimClient(WallPongSim(), wire, server_address).run)
+	sim.daemon = True
+	sim.start()
+
+# **************************************************************************
+# Main While loop to run DDQN RL process
+# Each time round the loop, one game frame is processed for every game with data waiting.
+# Training variables are kept separately for each game (by client address)
+games = {}			# training and episode varibles for each connected game
+fcount = fcount_start		# frame (in data) count over all games
+episode = episode_start		# episode count over all games
+print('waiting for connections')
+try:
+	while episode < num_episods+1:
+
+		# Get the next game frame from each game with data waiting
+		decide = []		# games that need a new action from the agent
+		for client_address, data_int in server.poll():
+
+			# Game closed its connection
+			if data_int is None:
+				games.pop(client_address, None)
+				continue
+
+			# New game: initialize training and episode varibles
+			if client_address not in games:
+				games[client_address] = {"fcount": 1, "action": 0, "reward": 0, "episode_reward": 0, "message": wire.encode(0, 0),
+										 "oldstate": np.zeros((1, state_size)), "newstate": np.zeros((1, state_size))}
+			game = games[client_address]
+
+			# Extract and process new game state data, reward and done (see wallPong_aTrain.py for details)
+			new_state_data = data_int[0:5]
+			newstate = [new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[4]]
+			game["newstate"] = np.reshape(newstate, [1, state_size])
+			game["reward"] = game["reward"] + data_int[5]-1
+			done = data_int[6]
+
+			# If end of game episode, process replay memeory with done at end (i.e., 1)
+			if done:
+				game["episode_reward"] = game["episode_reward"]+game["reward"]
+				agent.remember(game["oldstate"], game["action"], game["reward"], game["newstate"], 1, source=client_address)
+				trainer.replay(reply_size, fcount)
+
+				# Print and save current episode data
+				print("Episode: {}, Game: {}, Frame Count: {},  Epsilon: {},  Total Episode Reward: {}".format(episode, client_address, fcount, agent.epsilon, game["episode_reward"]))
+				episodeDFile.write(str(episode) + "," + str(client_address[1]) + "," + str(fcount) + "," + str(agent.epsilon) + "," + str(game["episode_reward"]) + "\n")
+
+				# Save current weights for agent's NN model (written to file by background thread)
+				ckpt.episode_end(episode, game["episode_reward"])
+				agent.flush_replay_memory()
+				if snapshot_dir is not None:
+					agent.save_snapshot(snapshot_dir + "/snapshot.h5", fcount=fcount+1, episode=episode+1)
+
+				episode = episode+1
+				game["episode_reward"] = 0
+				game["reward"] = 0
+				game["action"] = 0
+				game["message"] = wire.encode(1, 0)						# set new outgoing message, with game rest=1 and action=0
+
+			# Process every n-frames (the action for this game is chosen below, with all other games' actions)
+			elif game["fcount"] % pframe == 0:
+				game["episode_reward"] = game["episode_reward"]+game["reward"]
+				agent.remember(game["oldstate"], game["action"], game["reward"], game["newstate"], 0, source=client_address)
+				trainer.replay(reply_size, fcount)						# (once per transition, as in wallPong_aTrain.py)
+				decide.append(client_address)
+
+			if client_address not in decide:
+				server.send(client_address, game["message"])
+
+			# update target NN model after n-frames
+			if fcount % targ_update == 0:
+				trainer.update_target_model()
+			game["fcount"] = game["fcount"]+1
+			fcount = fcount+1
+
+		# Determine new actions for all deciding games with one forward pass
+		if decide:
+			actions = agent.act_batch(np.vstack([games[c]["newstate"] for c in decide]))
+			for client_address, action in zip(decide, actions):
+				game = games[client_address]
+				game["action"] = action
+				game["message"] = wire.encode(0, action)
+				game["oldstate"] = game["newstate"]
+				game["reward"] = 0
+				server.send(client_address, game["message"])
+
+finally:
+	# Clean up the connections
+	server.close()
+
+	#close edisode data file and finish writing weights files
+	episodeDFile.close()
+	ckpt.close()
+
+	# stop learner thread (if any) and earse (delete, clear) replay memory array (or save it, if kept in files)
+	if async_learning:
+		trainer.stop()
+	if replay_dir is None:
+		agent.erase_replay_memory()
+	else:
+		agent.flush_replay_memory()
+
+	# Close TCP socket
+	print("Client connections closed and reply memory earsed")
+	print("Closing TCP socket...")
+	sock.close()
+	print("Training Over\n\n")
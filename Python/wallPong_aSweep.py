@@ -0,0 +1,273 @@
+# *****************************************************************************
+# Example Hyperparameter Sweep Script for DQN Training on Wall Pong
+#
+# Trains one agent for each combination of the hyperparameter values in grid
+# (and each repeat, with the same seeds for every combination), running many training runs
+# at the same time in a pool of worker processes. Each worker:
+#   - plays its own game: an in-process simulated game (game_source = "sim"; no
+#     Unity game or TCP connection needed), or a Unity game connected to the
+#     worker's own port (game_source = "unity"; worker i listens on base_port + i)
+#   - is pinned to its own CPU core (with os.sched_setaffinity (Python 3), psutil or taskset;
+#     a warning is printed if none is available)
+#   - caps TensorFlow (and numpy/BLAS) to worker_threads threads, so the workers
+#     do not compete for the same cores
+# Each run is done in a new worker process (so each run has a new TensorFlow
+# graph and session). The episode rewards of all runs are saved to one csv file,
+# and a summary of each run (one row per run, with its hyperparameters) to another.
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# 1. In Terminal, activate virtual env, with Python 2.7, tensorflow and keras installed
+# 2. run this script
+# 3. if game_source = "unity", start one unity game per worker and connect each to a worker's port
+#
+# *****************************************************************************
+
+# **************************************************************************
+# Import Python Packages and Libraries
+import os
+import time
+import random
+import socket
+import itertools
+import subprocess
+import multiprocessing
+
+# **************************************************************************
+# Initialize sweep parameters
+# Hyperparameter values to sweep (every combination is trained)
+grid = {"gamma": [.99],				# discount rate
+		"learning_rate": [.001, .0005],	# NN learning rate
+		"epsilon_decay": [.9999],		# exploration decay rate (per decision step)
+		"epsilon_min": [.05],			# minimum exploration rate
+		"epsilon_delay": [25000],		# delay (n-frames) before exploration decay starts
+		"reply_size": [32, 64],			# size of action replay minibatch
+		"targ_update": [1000],			# specifies when the target model is updated, i.e., every n frames
+		"pframe": [4]}					# specifies frame downsample factor (i.e., process action only every n frames)
+repeats = 1			# number of runs of each combination (repeat r uses random seed seed + r)
+seed = 0			# random seed of the first repeat (the same seeds are used for every combination, so combinations are compared on the same seeds)
+num_episods = 500	# number of episodes used for training (per run)
+state_size = 5		# set environment state size (wallPong: ball x, ball y, ball x velocity, ball y velocity, paddle y)
+action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up; 2=down)
+memory_length = 200000	# size of replay memory (per run)
+prioritized = False	# use prioritized experience replay (sample transitions proportional to TD error)
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+protocol = "text"	# Unity wire protocol ("text" = space-separated ASCII, "binary" = fixed-size packed float32/int32 records)
+game_source = "sim"	# play an in-process simulated game ("sim") or a Unity game over TCP ("unity") in each worker
+base_port = 10000	# TCP port of worker 0 (worker i listens on base_port + i, if game_source = "unity")
+num_workers = multiprocessing.cpu_count()	# number of training runs at the same time (worker processes)
+pin_cpus = True		# pin each worker process to its own CPU core
+worker_threads = 1	# max number of TensorFlow intra-op and inter-op (and numpy/BLAS) threads per worker
+summary_last = 50	# number of last episodes averaged for each run's summary reward
+
+# **************************************************************************
+# Cap numpy/BLAS threads (set before numpy is imported, as the thread pools are created on import)
+for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+	os.environ[var] = str(worker_threads)
+import numpy as np
+
+# **************************************************************************
+# Import DDQN_Agent from Agent, wire protocols from UnityLink and simulated game from SimGames
+from Agent import DDQN_Agent as unityAgent
+from UnityLink import get_protocol, FrameReceiver
+from SimGames import SimConnection, WallPongSim
+
+# **************************************************************************
+# Worker slot of the current worker process (a slot is a CPU core and a port, used by one run at a time)
+slots = None
+
+# Initialize a worker process (keeps the queue of free worker slots)
+def init_worker(slot_queue):
+	global slots
+	slots = slot_queue
+
+# Pin the worker process to a CPU core: with os.sched_setaffinity (Python 3), psutil (if installed) or the
+# taskset command (Linux); returns False if none of them is available
+def pin_worker(slot):
+	if hasattr(os, "sched_setaffinity"):
+		cpus = sorted(os.sched_getaffinity(0))
+		os.sched_setaffinity(0, [cpus[slot % len(cpus)]])
+		return True
+	try:
+		import psutil
+		process = psutil.Process()
+		cpus = sorted(process.cpu_affinity())
+		process.cpu_affinity([cpus[slot % len(cpus)]])
+		return True
+	except (ImportError, AttributeError):	# (no psutil, or no cpu_affinity on this platform)
+		pass
+	try:
+		cpus = range(multiprocessing.cpu_count())
+		with open(os.devnull, "w") as devnull:
+			return subprocess.call(["taskset", "-p", "-c", str(cpus[slot % len(cpus)]), str(os.getpid())], stdout=devnull, stderr=devnull) == 0
+	except OSError:		# (no taskset command)
+		return False
+
+# Pin the worker process to a CPU core, cap TensorFlow threads and seed TensorFlow (before the agent's NN is built)
+def setup_worker(slot, run_seed):
+	if pin_cpus and not pin_worker(slot):
+		print("WARNING: pin_cpus is set, but worker {} could not be pinned to a CPU core (install psutil, or taskset on Linux); workers may compete for the same cores".format(slot))
+	if backend == "keras":
+		import tensorflow as tf
+		from keras import backend as K
+		K.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=worker_threads, inter_op_parallelism_threads=worker_threads)))
+		tf.set_random_seed(run_seed)
+
+# Run one training run in a free worker slot; returns (run id, hyperparameters, seed, episode data rows, seconds)
+def train_run(run):
+	slot = slots.get()
+	try:
+		setup_worker(slot, run[2])
+		start = time.time()
+		rows = train(run[1], run[2], slot)
+		return run + (rows, time.time() - start)
+	finally:
+		slots.put(slot)
+
+# Train an agent on Wall Pong with the given hyperparameters (as in wallPong_aTrain.py)
+# Returns the episode data (episode, frame, epsilon, episode reward) of each episode
+def train(params, run_seed, slot):
+	np.random.seed(run_seed)
+	random.seed(run_seed)
+	wire = get_protocol(protocol, 5, 2, 1)
+	reply_size, targ_update, pframe = params["reply_size"], params["targ_update"], params["pframe"]
+
+	# Initiate agent
+	agent = unityAgent(state_size, action_size, params["gamma"], params["learning_rate"], 1.0, params["epsilon_decay"], params["epsilon_min"], params["epsilon_delay"], memory_length, prioritized, backend=backend)
+
+	# Connect to the worker's game (an in-process simulated game, or a Unity game on the worker's port)
+	sock = None
+	if game_source == "sim":
+		connection = SimConnection(WallPongSim(run_seed), wire)
+	else:
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		sock.bind(('localhost', base_port + slot))
+		sock.listen(1)
+		print('worker {} waiting for a connection on port {}'.format(slot, base_port + slot))
+		connection, client_address = sock.accept()
+
+	# Initialize training and episode varibles
+	rows = []			# episode data
+	fcount = 1			# frame (in data) count
+	episode = 1			# episode count
+	action = 0			# agent action
+	reward = 0			# reward received for action made by agent
+	episode_reward = 0	# total reward score for episode
+	oldstate = np.zeros((1, state_size))
+	receiver = FrameReceiver(connection, wire)
+	connection.sendall(wire.encode(1, 0))
+	message = wire.encode(0, action)
+	try:
+		while episode < num_episods+1:
+
+			# Get and process the next game frame (see wallPong_aTrain.py for details)
+			data_int = receiver.recv_frame()
+			if data_int is None:
+				break
+			new_state_data = data_int[0:5]
+			newstate = np.reshape([new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[4]], [1, state_size])
+			reward = reward + data_int[5]-1
+			done = data_int[6]
+
+			# If end of game episode, process replay memeory with done at end (i.e., 1)
+			if done:
+				episode_reward = episode_reward+reward
+				agent.remember(oldstate, action, reward, newstate, 1)
+				agent.replay(reply_size, fcount)
+				rows.append((episode, fcount, agent.epsilon, episode_reward))
+				episode = episode+1
+				episode_reward = 0
+				reward = 0
+				action = 0
+				message = wire.encode(1, 0)
+
+			# Process every n-frames
+			elif fcount % pframe == 0:
+				episode_reward = episode_reward+reward
+				agent.remember(oldstate, action, reward, newstate, 0)
+				agent.replay(reply_size, fcount)
+				action = agent.act(newstate)
+				message = wire.encode(0, action)
+				oldstate = newstate
+				reward = 0
+
+			connection.sendall(message)
+
+			# update target NN model after n-frames
+			if fcount % targ_update == 0:
+				agent.update_target_model()
+			fcount = fcount+1
+	finally:
+		connection.close()
+		if sock is not None:
+			sock.close()
+		agent.erase_replay_memory()
+	return rows
+
+if __name__ == "__main__":
+
+	# **************************************************************************
+	# Make the list of runs (run id, hyperparameters, seed): every combination of grid values, repeated
+	names = sorted(grid)
+	runs = []
+	for values in itertools.product(*[grid[name] for name in names]):
+		for r in range(repeats):
+			runs.append((len(runs) + 1, dict(zip(names, values)), seed + r))
+
+	# **************************************************************************
+	# Initialize sweep directory (folder) and data files
+	timestr = time.strftime("%Y%m%d_%H%M%S")
+	sfiledir = "./aWSweepData_" + timestr
+	if not os.path.exists(sfiledir):
+		os.makedirs(sfiledir)
+
+	episodeDfname = sfiledir + "/episodeData_" + timestr + ".csv"
+	episodeDFile = open(episodeDfname, "w")
+	episodeDFile.write("Run, Episode, Frame, Epsilon, EpisodeReward\n")
+
+	sweepDfname = sfiledir + "/sweepData_" + timestr + ".csv"
+	sweepDFile = open(sweepDfname, "w")
+	sweepDFile.write("Run, " + ", ".join(names) + ", Seed, Episodes, Frames, Seconds, MeanReward, LastMeanReward, BestReward\n")
+
+	# **************************************************************************
+	# Save sweep parameters
+	sPfname = sfiledir + "/sweepParameters" + timestr + ".txt"
+	sPfile = open(sPfname, "w")
+	sPfile.write("Grid: " + str(grid) + "\n")
+	sPfile.write("Repeats: " + str(repeats) + "\n")
+	sPfile.write("Seed: " + str(seed) + "\n")
+	sPfile.write("Number of episodes: " + str(num_episods) + "\n")
+	sPfile.write("Memory length: " + str(memory_length) + "\n")
+	sPfile.write("Prioritized replay: " + str(prioritized) + "\n")
+	sPfile.write("Backend: " + backend + "\n")
+	sPfile.write("Game source: " + game_source + "\n")
+	sPfile.write("Number of workers: " + str(num_workers) + "\n")
+	sPfile.write("Worker threads: " + str(worker_threads) + "\n")
+	sPfile.close()
+
+	# **************************************************************************
+	# Run the training runs in a pool of worker processes (one new process per run) and save the results
+	# of each run as it finishes
+	slot_queue = multiprocessing.Queue()
+	for i in range(num_workers):
+		slot_queue.put(i)
+	pool = multiprocessing.Pool(num_workers, init_worker, (slot_queue,), maxtasksperchild=1)
+	try:
+		for run_id, params, run_seed, rows, seconds in pool.imap_unordered(train_run, runs):
+			for episode, fcount, epsilon, episode_reward in rows:
+				episodeDFile.write(str(run_id) + "," + str(episode) + "," + str(fcount) + "," + str(epsilon) + "," + str(episode_reward) + "\n")
+			rewards = [row[3] for row in rows] or [0]
+			sweepDFile.write(str(run_id) + "," + ",".join(str(params[name]) for name in names) + "," + str(run_seed) + "," + str(len(rows)) + ","
+							 + str(rows[-1][1] if rows else 0) + "," + str(round(seconds, 1)) + "," + str(np.mean(rewards)) + ","
+							 + str(np.mean(rewards[-summary_last:])) + "," + str(max(rewards)) + "\n")
+			sweepDFile.flush()
+			episodeDFile.flush()
+			print("Run: {} of {}, Params: {}, Seed: {}, Seconds: {:.1f},  Last {} Episodes Mean Reward: {}".format(run_id, len(runs), params, run_seed, seconds, summary_last, np.mean(rewards[-summary_last:])))
+		pool.close()
+	finally:
+		# Stop worker processes (any unfinished runs are stopped) and close data files
+		pool.terminate()
+		pool.join()
+		episodeDFile.close()
+		sweepDFile.close()
+		print("Sweep Over\n\n")
@@ -24,6 +24,8 @@ import numpy as np
 # **************************************************************************
 # Import DDQN_Agent from Agent
 from Agent import DDQN_Agent as unityAgent
+from UnityLink import get_protocol, FrameReceiver
+from SimGames import SimConnection, WallPongSim
 
 
 # **************************************************************************
@@ -32,11 +34,27 @@ num_episods = 10	# number of episodes used for training
 state_size = 5		# set environment state size (wallPong: ball x, ball y, ball x velocity, ball y velocity, paddle y)
 action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up; 2=down)
 pframe = 4			# specifies frame downsample factor (i.e., process action only every n frames)
+protocol = "text"	# Unity wire protocol ("text" = space-separated ASCII, "binary" = fixed-size packed float32/int32 records)
+frame_policy = "all"	# process every received game frame in order ("all") or only the most recent queued frame and any frames with a reward or done ("latest")
+game_source = "unity"	# play the Unity game over TCP ("unity") or an in-process simulated game ("sim")
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+
+# **************************************************************************
+# Initialize wire protocol for game messages (5 floats and 2 integers in, reset and 1 action(s) out)
+wire = get_protocol(protocol, 5, 2, 1)
+
+# **************************************************************************
+# Create a TCP/IP socket (bound before the agent is built, so a game can connect straight away)
+sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
+server_address = ('localhost', 10000)					 # Set TCP server address
+sock.bind(server_address)								 # Bind the TCP socket address to the port
+print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
+sock.listen(1)											 # Listen for incoming connections
 
 # **************************************************************************
 # Initiate agent and agent variables
 # unityAgent=(state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length)
-agent = unityAgent(state_size, action_size, 0, 0, 0, 0, 0, 0, 0)	# all hyperparameters set to zero for testing
+agent = unityAgent(state_size, action_size, 0, 0, 0, 0, 0, 0, 0, backend=backend, background_build=True)	# all hyperparameters set to zero for testing
 newstate = np.reshape([0,0,0,0,0], [1, state_size])					# Initialize new game state cache (array)
 
 
@@ -45,28 +63,22 @@ newstate = np.reshape([0,0,0,0,0], [1, state_size])					# Initialize new game st
 wafname = "./wallpong_twEx.h5"
 agent.load(wafname)
 
-
-# **************************************************************************
-# Create a TCP/IP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
-server_address = ('localhost', 10000)					 # Set TCP server address
-sock.bind(server_address)								 # Bind the TCP socket address to the port
-print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
-sock.listen(1)											 # Listen for incoming connections
-
-
 # **************************************************************************
 # Main While loop to run DDQN RL process
 # First, waits for clinet connection from unity game
 # Once clinet connects, 
 while True:
-	# Wait for a connection
-	print('waiting for a connection')
-	connection, client_address = sock.accept()
+	# Wait for a connection (or connect to an in-process simulated game)
+	if game_source == "sim":
+		connection, client_address = SimConnection(WallPongSim(), wire), "simulated game"
+	else:
+		print('waiting for a connection')
+		connection, client_address = sock.accept()
 
 	try:
 		# Connection from unity client made
 		print('connection from', client_address)
+		receiver = FrameReceiver(connection, wire, frame_policy)	# buffered receiver returning complete game frames
 
 		# Initialize training and episode varibles
 		fcount = 1			# frame (in data) count
@@ -78,10 +90,10 @@ while True:
 		# send initial rest and action message to game to start game
 		# wallPong game expects two integer values (rest, action)
 		# to rest game, reset = 1, otherwise set reset=0	
-		connection.sendall('1 0 ')
+		connection.sendall(wire.encode(1, 0))
 
 		# reset initial (default) message string
-		message = "0 {} ".format(action)
+		message = wire.encode(0, action)
 
 		# Complete training
 		while episode < num_episods+1:
@@ -89,14 +101,11 @@ while True:
 			# Check for new game data
 			# for wallPong incomming game data is a string of 5 floats and 2 integers. 
 			# The data order is as follows: ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle_y, reward, done
-			data = connection.recv(33)
-			#print('received: %s' % data)
+			data_int = receiver.recv_frame()
+			#print('received: {}'.format(data_int))
 
-			# Process game data if received
-			if data:
-
-            	# Process new game data by first split data into a float array.
-				data_int = map(float, data.split())	
+			# Process game data if received (data_int is None if the game closed the connection)
+			if data_int is not None:
 
 				# Extract and process new game state data (ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle_y)
 				# NOTE 1:   x and y positions sent from unity on normlazied range 0 to 1, where:
@@ -126,14 +135,14 @@ while True:
 					episode_reward = 0										# rest total reward for episode
 					reward = 0												# rest current reward
 					action = 0												# set action to 0
-					message = "1 0 "										# set new outgoing message, with game rest=1 and action=0
+					message = wire.encode(1, 0)										# set new outgoing message, with game rest=1 and action=0
 				
 				else:
 					# Process every n-frames or if game is done (over)
 					if fcount % pframe == 0:
 						episode_reward = episode_reward+reward 					# update episode reward
 						action = agent.act(newstate)							# determine new action from new state data
-						message = "0 {} ".format(action)						# set new outgoing message with game action
+						message = wire.encode(0, action)						# set new outgoing message with game action
 						reward = 0												# rest current reward
 				
 				# send current rest and action message to unity game	
@@ -150,3 +159,8 @@ while True:
 	finally:
 		# Clean up the connection
 		connection.close()
+
+		# A simulated game is only played once (a Unity game can reconnect)
+		if game_source == "sim":
+			sock.close()
+			break
\ No newline at end of file
@@ -26,6 +26,12 @@ import numpy as np
 # **************************************************************************
 # Import DDQN_Agent from Agent
 from Agent import DDQN_Agent as unityAgent
+from Learner import Learner
+from Checkpoint import CheckpointManager
+from Profiler import PhaseTimer
+from History import FrameHistory
+from UnityLink import get_protocol, FrameReceiver
+from SimGames import SimConnection, WallPongSim
 
 # **************************************************************************
 # Initialize DDQL training and (s, a) state parameters
@@ -35,13 +41,55 @@ action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up;
 reply_size = 32 	# size of action replay minibatch
 targ_update = 1000	# specifies when the target model is updated, i.e., every n frames
 pframe = 4			# specifies frame downsample factor (i.e., process action only every n frames)
+prioritized = False	# use prioritized experience replay (sample transitions proportional to TD error)
+async_learning = False	# train in a background learner thread (the game loop only acts and remembers)
+train_every = 1		# train the agent's NN every n replay calls (i.e., every n decision steps; 1 = every decision step)
+gradient_steps = 1	# number of minibatches (gradient steps) trained per training step (sampled in one go and trained with one fit call)
+n_step = 1			# number of rewards per remembered transition (n-step returns, bootstrapped from the state n decision steps later; 1 = 1-step)
+tau = None			# soft (Polyak) target model update rate per training step, e.g., .005 (None = copy weights to the target model every targ_update frames)
+replay_storage = "float32"	# replay memory state storage ("float32", or compact "float16" or "int16" = scaled 16 bit integers, which also store actions as bytes and done flags as bits: about half the memory per transition)
+history_length = 1	# number of most recent processed frames that form the agent's state (frame stacking; 1 = current frame only)
+ckpt_every = 1		# save agent's NN weights every n episodes (0 = never)
+ckpt_keep = 10		# number of most recent episode weights files kept (0 = keep all)
+ckpt_best = True	# also save NN weights for the best episode reward (as *_best.h5)
+protocol = "text"	# Unity wire protocol ("text" = space-separated ASCII, "binary" = fixed-size packed float32/int32 records)
+frame_policy = "all"	# process every received game frame in order ("all") or only the most recent queued frame and any frames with a reward or done ("latest")
+game_source = "unity"	# play the Unity game over TCP ("unity") or an in-process simulated game ("sim")
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+replay_dir = None	# directory for memory-mapped replay memory files, kept after training so training can be resumed with the same memory (None = memory in RAM, erased after training)
+snapshot_dir = None	# directory for training state snapshots (weights, target model, optimizer, epsilon, frame and episode counts), saved every episode; training resumes from them if they exist (None = no snapshots)
+profile = False		# time each phase of the training loop (recv, parse, remember, replay, act, send, ...) and save stats to profileData_*.csv
+profile_every = 10	# print and save profile stats (per-phase times, histograms and frames per second) every n episodes
+
+# **************************************************************************
+# Initialize wire protocol for game messages (5 floats and 2 integers in, reset and 1 action(s) out)
+wire = get_protocol(protocol, 5, 2, 1)
+
+# **************************************************************************
+# Create a TCP/IP socket (bound before the agent is built, so a game can connect straight away)
+sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
+server_address = ('localhost', 10000)					 # Set TCP server address
+sock.bind(server_address)								 # Bind the TCP socket address to the port
+print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
+sock.listen(1)											 # Listen for incoming connections
 
 # **************************************************************************
 # Initiate agent and agent variables
-# unityAgent=(state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length)
-agent = unityAgent(state_size, action_size, .99, .001, 1.0, .9999, .05, 25000, 200000)
-newstate = np.reshape([0,0,0,0,0], [1, state_size])		# Initialize new game state cache (array)
-oldstate = np.reshape([0,0,0,0,0], [1, state_size])		# Initialize old game state cache (array)
+# unityAgent=(state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length, prioritized, backend)
+agent = unityAgent(state_size, action_size, .99, .001, 1.0, .9999, .05, 25000, 200000, prioritized, backend=backend, background_build=True, memory_path=replay_dir, train_every=train_every, gradient_steps=gradient_steps, history_length=history_length, n_step=n_step, tau=tau, replay_storage=replay_storage)
+if snapshot_dir is not None and not os.path.exists(snapshot_dir):
+	os.makedirs(snapshot_dir)
+fcount_start, episode_start = 1, 1						# frame and episode counts training starts from
+if snapshot_dir is not None and os.path.exists(snapshot_dir + "/snapshot.h5"):
+	counters = agent.load_snapshot(snapshot_dir + "/snapshot.h5")		# resume training from last training state snapshot
+	fcount_start, episode_start = counters["fcount"], counters["episode"]
+	print("Resuming training from episode {} (frame {})".format(episode_start, fcount_start))
+trainer = Learner(agent, reply_size, targ_update // pframe) if async_learning else agent	# trains agent (replay and target model updates)
+if async_learning:
+	trainer.start()
+history = FrameHistory(state_size, history_length)		# last history_length processed frames (the agent's state)
+newstate = np.zeros([1, state_size * history_length])	# Initialize new game state cache (array)
+oldstate = np.zeros([1, state_size * history_length])	# Initialize old game state cache (array)
 #agent.load("./aWData_20170728_131503/aw_ep213.h5") 		# If pre-loading network weights, do that here
 
 # **************************************************************************
@@ -51,12 +99,21 @@ wfiledir = "./aWData_" + timestr
 if not os.path.exists(wfiledir):
     os.makedirs(wfiledir)
 
+# **************************************************************************
+# Initialize checkpoint manager(s) (NN weights files are written by a background thread)
+ckpt = CheckpointManager(agent, wfiledir + "/aw", ckpt_every, ckpt_keep, ckpt_best)
+
 # **************************************************************************
 # Initialize episode/training data file (for post-training analysis)
 episodeDfname = wfiledir + "/episodeData_" + timestr + ".csv"
 episodeDFile = open(episodeDfname, "w")
 episodeDFile.write("Episode, Frame, Epsilon, EpisodeReward\n")
 
+# **************************************************************************
+# Initialize per-phase timer (profiling) and profile data file (stats are saved every profile_every episodes)
+profileDfname = wfiledir + "/profileData_" + timestr + ".csv"
+prof = PhaseTimer(profileDfname, profile)
+
 # **************************************************************************
 # Save agent parameters
 aDfname = wfiledir + "/agentParameters" + timestr + ".txt"		
@@ -71,44 +128,43 @@ tDfile.write("State size: " + str(state_size) + "\n")
 tDfile.write("Action size: " + str(action_size) + "\n")
 tDfile.write("Reply size: " + str(reply_size) + "\n")
 tDfile.write("Frame downsample factor: " + str(pframe) + "\n")
+tDfile.write("Wire protocol: " + protocol + "\n")
+tDfile.write("History length: " + str(history_length) + "\n")
 tDfile.close()
 
-# **************************************************************************
-# Create a TCP/IP socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Initialize TCP socket
-server_address = ('localhost', 10000)					 # Set TCP server address
-sock.bind(server_address)								 # Bind the TCP socket address to the port
-print('starting up on %s port %s' % server_address)		 # Print TCP socket info to terminal
-sock.listen(1)											 # Listen for incoming connections
-
-
 # **************************************************************************
 # Main While loop to run DDQN RL process
 # First, waits for clinet connection from unity game
 # Once clinet connects, 
 while True:
-	# Wait for a connection
-	print('waiting for a connection')
-	connection, client_address = sock.accept()
+	# Wait for a connection (or connect to an in-process simulated game)
+	if game_source == "sim":
+		connection, client_address = SimConnection(WallPongSim(), wire), "simulated game"
+	else:
+		print('waiting for a connection')
+		connection, client_address = sock.accept()
 
 	try:
 		# Connection from unity client made
 		print('connection from', client_address)
+		receiver = FrameReceiver(connection, wire, frame_policy, timer=prof)	# buffered receiver returning complete game frames
 
 		# Initialize training and episode varibles
-		fcount = 1			# frame (in data) count
-		episode = 1			# episode count
+		fcount = fcount_start		# frame (in data) count
+		episode = episode_start		# episode count
 		action = 0			# agent action
 		reward = 0			# reward received for action made by agent
 		episode_reward = 0	# total reward score for episode
+		new_episode = True	# next processed frame is the first of an episode (starts a new frame history)
 
 		# send initial rest and action message to game to start game
 		# wallPong game expects two integer values (rest, action)
 		# to rest game, reset = 1, otherwise set reset=0	
-		connection.sendall("1 0 ")
+		connection.sendall(wire.encode(1, 0))
         
 		# reset initial (default) message string
-		message = "0 {} ".format(action)
+		message = wire.encode(0, action)
+		prof.lap()
 
 		# Complete training
 		while episode < num_episods+1:
@@ -116,14 +172,11 @@ while True:
 			# Check for new game data
 			# for wallPong incomming game data is a string of 5 floats and 2 integers. 
 			# The data order is as follows: ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle_y, reward, done
-			data = connection.recv(33)
-			#print('received: {}'.format(data))
+			data_int = receiver.recv_frame()
+			#print('received: {}'.format(data_int))
 
-			# Process game data if received
-			if data:
-
-            	# Process new game data by first split data into a float array.
-				data_int = map(float, data.split())	
+			# Process game data if received (data_int is None if the game closed the connection)
+			if data_int is not None:
 
 				# Extract and process new game state data (ball_x, ball_y, ball_x_velocity, ball_y_velocity, paddle_y)
 				# NOTE 1:   x and y positions sent from unity on normlazied range 0 to 1, where:
@@ -131,57 +184,81 @@ while True:
 				#			bottom wall is at y = 0; and top wall is at y = 1
 				# NOTE 2:   x and y velocities sent from unity on normlazied range 0 to 2, where 1 = 0 velocity, 
 				#			hence a -1 is added to vel;ocities to rescale them to -1 to 1 (i.e., normalized neg to pos velocities)
-				# NOTE 3:	newstate is reshaped, as this is the shape that Keras NN expects the state data to be in
+				# NOTE 3:	newstate is the last history_length processed frames (added to the frame history below), as
+				#			one row, as this is the shape that Keras NN expects the state data to be in
 				new_state_data = data_int[0:5]
-				newstate = [new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[4]]
-				newstate = np.reshape(newstate, [1, state_size])
+				frame = [new_state_data[0],new_state_data[1]-1,new_state_data[2],new_state_data[3]-1,new_state_data[4]]
 
 				# Extract reward (last value in game data) and whether current game episdoe is done (over) or not
 				# NOTE 4: rewards sent as positive intergers, which are processed here as: 0=-1, 1=0, 2=1
 				reward = reward + data_int[5]-1
 				done = data_int[6]
+				prof.mark("process")
 
 				# If end of game episode, process replay memeory with done at end (i.e., 1)
 				# Output current episdoe data to terminal window
 				if done:
 					episode_reward = episode_reward+reward 					# update episode reward
+					newstate = history.push(frame)							# add new frame to frame history
 					agent.remember(oldstate, action, reward, newstate, 1)	# add new dtata to agent replay memory
-					agent.replay(reply_size, fcount) 						# process action replay minibatch
+					prof.mark("remember")
+					trainer.replay(reply_size, fcount) 						# process action replay minibatch
+					prof.mark("replay")
 
 					# Print and save current episode data			
 					print("Episode: {}, Frame Count: {},  Epsilon: {},  Total Episode Reward: {}".format(episode, fcount, agent.epsilon, episode_reward))
 					episodeDFile.write(str(episode) + "," + str(fcount) + "," + str(agent.epsilon) + "," + str(episode_reward) + "\n")
+					prof.mark("log")
+
+					# Save current weights for agent's NN model (written to file by background thread)
+					ckpt.episode_end(episode, episode_reward)
+					agent.flush_replay_memory()								# save replay memory position (if kept in files)
+					if snapshot_dir is not None:
+						agent.save_snapshot(snapshot_dir + "/snapshot.h5", fcount=fcount+1, episode=episode+1)	# save training state (to resume from next episode)
+					prof.mark("checkpoint")
 
-					# Save current weights for agent' sNN model
-					afname = wfiledir + "/aw_ep" + str(episode) + ".h5"		# set filename for current model weights for agent
-					agent.save(afname)										# save cuurent model (NN) weights to file for agent
+					# Print and save profile stats (if profiling)
+					if episode % profile_every == 0:
+						prof.dump(episode)
 
 					episode = episode+1										# increase episode count
 					episode_reward = 0										# rest total reward for episode
 					reward = 0												# rest current reward
 					action = 0												# set action to 0
-					message = "1 0 "										# set new outgoing message, with game rest=1 and action=0
+					new_episode = True										# start a new frame history
+					message = wire.encode(1, 0)										# set new outgoing message, with game rest=1 and action=0
 				
 				else:
 					# Process every n-frames or if game is done (over)
 					if fcount % pframe == 0:
 						episode_reward = episode_reward+reward 					# update episode reward
-						agent.remember(oldstate, action, reward, newstate, 0)	# add new dtata to agent replay memory
-						agent.replay(reply_size, fcount)						# process action replay minibatch
+						if new_episode and history_length > 1:
+							newstate = history.reset(frame)						# start a new frame history (with frame stacking, no transition from the last episode's state is remembered)
+						else:
+							newstate = history.push(frame)						# add new frame to frame history
+							agent.remember(oldstate, action, reward, newstate, 0)	# add new dtata to agent replay memory
+						new_episode = False
+						prof.mark("remember")
+						trainer.replay(reply_size, fcount)						# process action replay minibatch
+						prof.mark("replay")
 						action = agent.act(newstate)							# determine new action from new state data
-						message = "0 {} ".format(action)						# set new outgoing message with game action
-						oldstate = newstate 									# save new state data as old state data
+						prof.mark("act")
+						message = wire.encode(0, action)						# set new outgoing message with game action
+						oldstate = np.copy(newstate) 							# save new state data as old state data (a copy, as newstate is a view of the frame history)
 						reward = 0												# rest current reward
 				
 				# send current rest and action message to unity game	
 				connection.sendall(message)
+				prof.mark("send")
 
 				# update target NN model after n-frames
 				if fcount % targ_update == 0:
-					agent.update_target_model()								# update agent's target model (NN)
+					trainer.update_target_model()								# update agent's target model (NN)
+					prof.mark("target")
 
 				# update frame count
 				fcount = fcount+1
+				prof.frame()
 
 			else:
 				# break if no more data comming in from client
@@ -192,11 +269,17 @@ while True:
 		# Clean up the connection
 		connection.close()
 
-		#close edisode data file
+		#close edisode data file and finish writing weights files
 		episodeDFile.close()
+		ckpt.close()
 
-		# earse (delete, clear) replay memory array
-		agent.erase_replay_memory()
+		# stop learner thread (if any) and earse (delete, clear) replay memory array (or save it, if kept in files)
+		if async_learning:
+			trainer.stop()
+		if replay_dir is None:
+			agent.erase_replay_memory()
+		else:
+			agent.flush_replay_memory()
 
 		# Close TCP connnection and socket and break to exit
 		print("Client connection closed and reply memory earsed")
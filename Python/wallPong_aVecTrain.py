@@ -0,0 +1,163 @@
+# *****************************************************************************
+# Example DQN Training Script using a Batch of Simulated Wall Pong Games
+#
+# Trains a single agent on N simulated (headless) Wall Pong games stepped in
+# lockstep, with the actions for all N games chosen using one forward pass.
+# Replay (training and epsilon decay) is processed once per remembered transition,
+# so the schedule per transition is the same as in wallPong_aTrain.py.
+# No Unity game (or TCP connection) is required.
+# Use Python 2.7. (NOT tested using Python 3!)
+#
+# 1. In Terminal, activate virtual env, with Python 2.7, tensorflow and keras installed
+# 2. run this script
+#
+# *****************************************************************************
+
+# **************************************************************************
+# Import Python Packages and Libraries
+import os
+import time
+import numpy as np
+
+# **************************************************************************
+# Import DDQN_Agent from Agent and batch of simulated Wall Pong games from SimGames
+from Agent import DDQN_Agent as unityAgent
+from Learner import Learner
+from Checkpoint import CheckpointManager
+from SimGames import WallPongVecSim
+
+# **************************************************************************
+# Initialize DDQL training and (s, a) state parameters
+num_episods = 2000	# number of episodes used for training (total over all games)
+state_size = 5		# set environment state size (wallPong: ball x, ball y, ball x velocity, ball y velocity, paddle y)
+action_size = 4		# set number of actions possible (wallPong: 0=do nothing; 1=up; 2=down)
+reply_size = 32 	# size of action replay minibatch
+targ_update = 1000	# specifies when the target model is updated, i.e., every n frames
+pframe = 4			# specifies frame downsample factor (i.e., process action only every n frames)
+prioritized = False	# use prioritized experience replay (sample transitions proportional to TD error)
+async_learning = False	# train in a background learner thread (the game loop only acts and remembers)
+train_every = 1		# train the agent's NN every n replay calls (i.e., every n decision steps; 1 = every decision step)
+gradient_steps = 1	# number of minibatches (gradient steps) trained per training step (sampled in one go and trained with one fit call)
+n_step = 1			# number of rewards per remembered transition (n-step returns, bootstrapped from the state n decision steps later; 1 = 1-step)
+tau = None			# soft (Polyak) target model update rate per training step, e.g., .005 (None = copy weights to the target model every targ_update frames)
+replay_storage = "float32"	# replay memory state storage ("float32", or compact "float16" or "int16" = scaled 16 bit integers, which also store actions as bytes and done flags as bits: about half the memory per transition)
+ckpt_every = 1		# save agent's NN weights every n episodes (0 = never)
+ckpt_keep = 10		# number of most recent episode weights files kept (0 = keep all)
+ckpt_best = True	# also save NN weights for the best episode reward (as *_best.h5)
+num_games = 16		# number of simulated games stepped in lockstep
+backend = "keras"	# NN backend ("keras" or "numpy" = pure numpy forward pass and Adam training, no TensorFlow needed)
+
+# **************************************************************************
+# Initiate agent, games and agent variables
+# unityAgent=(state_size, action_size, gamma, learning_rate, epsilon, epsilon_decay, epsilon_min, epsilon_delay, memory_length, prioritized, backend)
+agent = unityAgent(state_size, action_size, .99, .001, 1.0, .9999, .05, 25000, 200000, prioritized, backend=backend, train_every=train_every, gradient_steps=gradient_steps, n_step=n_step, tau=tau, replay_storage=replay_storage)
+trainer = Learner(agent, reply_size, targ_update // pframe) if async_learning else agent	# trains agent (replay and target model updates)
+if async_learning:
+	trainer.start()
+games = WallPongVecSim(num_games)						# Initialize batch of simulated games
+newstate = np.zeros((num_games, state_size))			# Initialize new game state cache (one row per game)
+oldstate = np.zeros((num_games, state_size))			# Initialize old game state cache (one row per game)
+
+# **************************************************************************
+# Initialize weights directory (folder) and pre-filename string for saving agent's NN weights files
+timestr = time.strftime("%Y%m%d_%H%M%S")
+wfiledir = "./aWVecData_" + timestr
+if not os.path.exists(wfiledir):
+    os.makedirs(wfiledir)
+
+# **************************************************************************
+# Initialize checkpoint manager(s) (NN weights files are written by a background thread)
+ckpt = CheckpointManager(agent, wfiledir + "/aw", ckpt_every, ckpt_keep, ckpt_best)
+
+# **************************************************************************
+# Initialize episode/training data file (for post-training analysis)
+episodeDfname = wfiledir + "/episodeData_" + timestr + ".csv"
+episodeDFile = open(episodeDfname, "w")
+episodeDFile.write("Episode, Game, Frame, Epsilon, EpisodeReward\n")
+
+# **************************************************************************
+# Save agent parameters
+aDfname = wfiledir + "/agentParameters" + timestr + ".txt"
+agent.save_agent_parameters(aDfname)
+
+# **************************************************************************
+# Save training parameters
+tDfname = wfiledir + "/trainingParameters" + timestr + ".txt"
+tDfile = open(tDfname, "w")
+tDfile.write("Number of episodes: " + str(num_episods) + "\n")
+tDfile.write("State size: " + str(state_size) + "\n")
+tDfile.write("Action size: " + str(action_size) + "\n")
+tDfile.write("Reply size: " + str(reply_size) + "\n")
+tDfile.write("Frame downsample factor: " + str(pframe) + "\n")
+tDfile.write("Number of games: " + str(num_games) + "\n")
+tDfile.close()
+
+# **************************************************************************
+# Initialize training and episode varibles (one value per game)
+fcount = 1									# frame (in data) count
+episode = 1									# episode count (over all games)
+action = np.zeros(num_games, dtype=int)		# agent actions
+reward = np.zeros(num_games)				# reward received for action made by agent
+episode_reward = np.zeros(num_games)		# total reward score for episode
+done = np.ones(num_games, dtype=bool)		# games that are done (over), sent a reset (new game) with the next step (all games at the start)
+
+# **************************************************************************
+# Main While loop to run DDQN RL process
+# All games are stepped together and processed in the same way as wallPong_aTrain.py
+while episode < num_episods+1:
+
+	# Step all games using current actions (and reset games that are done); game data is an array with one
+	# game frame per row (ball_x, ball_x_velocity, ball_y, ball_y_velocity, paddle_y, reward, done)
+	data = games.step(action, done)
+
+	# Extract and process new game state data (see wallPong_aTrain.py for details)
+	newstate = data[:, 0:5] - [0, 1, 0, 1, 0]
+
+	# Extract rewards (processed as: 0=-1, 1=0, 2=1) and which games are done (over)
+	reward = reward + data[:, 5]-1
+	done = data[:, 6] > 0
+
+	# For games at end of episode, process replay memeory with done at end (i.e., 1)
+	# Output episode data to terminal window and reset those games
+	if done.any():
+		for i in np.flatnonzero(done):
+			episode_reward[i] = episode_reward[i]+reward[i]								# update episode reward
+			agent.remember(oldstate[i], action[i], reward[i], newstate[i], 1, source=i)			# add new dtata to agent replay memory
+			trainer.replay(reply_size, fcount) 						# process action replay minibatch (once per transition, as in wallPong_aTrain.py)
+
+			# Print and save current episode data
+			print("Episode: {}, Game: {}, Frame Count: {},  Epsilon: {},  Total Episode Reward: {}".format(episode, i, fcount, agent.epsilon, episode_reward[i]))
+			episodeDFile.write(str(episode) + "," + str(i) + "," + str(fcount) + "," + str(agent.epsilon) + "," + str(episode_reward[i]) + "\n")
+
+			# Save current weights for agent's NN model (written to file by background thread)
+			ckpt.episode_end(episode, episode_reward[i])
+
+			episode = episode+1										# increase episode count
+			episode_reward[i] = 0									# rest total reward for episode
+			reward[i] = 0											# rest current reward
+			action[i] = 0											# set action to 0
+
+	# Process every n-frames for games that are not done (over)
+	if fcount % pframe == 0:
+		live = ~done
+		episode_reward[live] = episode_reward[live]+reward[live] 	# update episode rewards
+		for i in np.flatnonzero(live):
+			agent.remember(oldstate[i], action[i], reward[i], newstate[i], 0, source=i)	# add new dtata to agent replay memory
+			trainer.replay(reply_size, fcount)						# process action replay minibatch (once per transition, as in wallPong_aTrain.py)
+		action = np.where(live, agent.act_batch(newstate), action)		# determine new actions for all games with one forward pass
+		oldstate[live] = newstate[live] 							# save new state data as old state data
+		reward[live] = 0											# rest current rewards
+
+	# update target NN model after n-frames
+	if fcount % targ_update == 0:
+		trainer.update_target_model()									# update agent's target model (NN)
+
+	# update frame count
+	fcount = fcount+1
+
+# stop learner thread (if any) and close edisode data file
+if async_learning:
+	trainer.stop()
+episodeDFile.close()
+ckpt.close()
+print("Training Over\n\n")